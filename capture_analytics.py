@@ -0,0 +1,120 @@
+import bisect
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# --- Configuration ---
+SESSION_GAP = 30 * 60  # seconds without a capture that end a session
+
+class CaptureAnalytics:
+    """Capture counts per hour, session, channel and ESSID, kept up to date one file at a time.
+
+    update() is handed the handshake index listing. Entries the index did not touch are the same
+    dict objects as last time, so only new, changed (re-stat-ed or annotated) and removed
+    captures are folded in; nothing is recounted. Sessions are runs of captures with gaps under
+    SESSION_GAP, and adding or removing a capture only re-splits the session it falls in.
+    """
+    def __init__(self, session_gap: float = SESSION_GAP):
+        self.session_gap = session_gap
+        self._listing: Optional[List[Dict[str, Any]]] = None
+        self._seen: Dict[str, Dict[str, Any]] = {}
+        self._timestamps: List[float] = []
+        self._sessions: List[List[float]] = []  # [start, end, captures], sorted by start
+        self.per_hour: Counter = Counter()
+        self.hour_of_day: Counter = Counter()
+        self.per_channel: Counter = Counter()
+        self.per_essid: Counter = Counter()
+
+    def update(self, listing: List[Dict[str, Any]]) -> int:
+        """Folds the differences since the previous listing in. Returns how many captures changed."""
+        if listing is self._listing:
+            return 0
+        changed = 0
+        current = set()
+        for entry in listing:
+            name = entry["name"]
+            current.add(name)
+            old = self._seen.get(name)
+            if old is entry:
+                continue
+            if old is not None: self._remove(old)
+            self._add(entry)
+            self._seen[name] = entry
+            changed += 1
+        for name in [name for name in self._seen if name not in current]:
+            self._remove(self._seen.pop(name))
+            changed += 1
+        self._listing = listing
+        return changed
+
+    def _add(self, entry: Dict[str, Any]):
+        timestamp = entry["timestamp"]
+        self.per_hour[int(timestamp // 3600 * 3600)] += 1
+        self.hour_of_day[time.localtime(timestamp).tm_hour] += 1
+        self.per_channel[entry.get("channel")] += 1
+        self.per_essid[entry.get("essid")] += 1
+        bisect.insort(self._timestamps, timestamp)
+        self._add_to_session(timestamp)
+
+    def _remove(self, entry: Dict[str, Any]):
+        timestamp = entry["timestamp"]
+        for counter, key in ((self.per_hour, int(timestamp // 3600 * 3600)), (self.hour_of_day, time.localtime(timestamp).tm_hour),
+                             (self.per_channel, entry.get("channel")), (self.per_essid, entry.get("essid"))):
+            counter[key] -= 1
+            if counter[key] <= 0: del counter[key]
+        position = bisect.bisect_left(self._timestamps, timestamp)
+        if position < len(self._timestamps) and self._timestamps[position] == timestamp:
+            del self._timestamps[position]
+        self._resplit_session(timestamp)
+
+    def _session_at(self, timestamp: float) -> int:
+        """Index of the last session starting at or before `timestamp`, or -1."""
+        return bisect.bisect_right(self._sessions, [timestamp, float("inf"), float("inf")]) - 1
+
+    def _add_to_session(self, timestamp: float):
+        i = self._session_at(timestamp)
+        joins_previous = i >= 0 and timestamp - self._sessions[i][1] <= self.session_gap
+        joins_next = i + 1 < len(self._sessions) and self._sessions[i + 1][0] - timestamp <= self.session_gap
+        if joins_previous and joins_next:
+            previous, following = self._sessions[i], self._sessions.pop(i + 1)
+            previous[1], previous[2] = following[1], previous[2] + following[2] + 1
+        elif joins_previous:
+            session = self._sessions[i]
+            session[1], session[2] = max(session[1], timestamp), session[2] + 1
+        elif joins_next:
+            session = self._sessions[i + 1]
+            session[0], session[2] = timestamp, session[2] + 1
+        else:
+            self._sessions.insert(i + 1, [timestamp, timestamp, 1])
+
+    def _resplit_session(self, timestamp: float):
+        """Rebuilds the session that held a removed capture from the captures left in its span."""
+        i = self._session_at(timestamp)
+        if i < 0:
+            return
+        start, end, _ = self._sessions.pop(i)
+        low, high = bisect.bisect_left(self._timestamps, start), bisect.bisect_right(self._timestamps, end)
+        rebuilt: List[List[float]] = []
+        for t in self._timestamps[low:high]:
+            if rebuilt and t - rebuilt[-1][1] <= self.session_gap:
+                rebuilt[-1][1], rebuilt[-1][2] = t, rebuilt[-1][2] + 1
+            else:
+                rebuilt.append([t, t, 1])
+        self._sessions[i:i] = rebuilt
+
+    def summary(self, hours: int = 24, top: int = 20, now: Optional[float] = None) -> Dict[str, Any]:
+        """Returns the last `hours` of hourly counts, every session, and the `top` channels and ESSIDs."""
+        now = time.time() if now is None else now
+        current_hour = int(now // 3600 * 3600)
+        timeline = [current_hour - 3600 * i for i in range(hours - 1, -1, -1)]
+        return {
+            "total": len(self._timestamps),
+            "per_hour": [{"hour": hour, "captures": self.per_hour.get(hour, 0)} for hour in timeline],
+            "hour_of_day": [self.hour_of_day.get(hour, 0) for hour in range(24)],
+            "sessions": [{
+                "start": start, "end": end, "captures": int(captures),
+                "per_hour": round(captures / max((end - start) / 3600, 1), 2),
+            } for start, end, captures in self._sessions],
+            "per_channel": [{"channel": channel, "captures": n} for channel, n in self.per_channel.most_common(top)],
+            "per_essid": [{"essid": essid, "captures": n} for essid, n in self.per_essid.most_common(top)],
+        }
@@ -0,0 +1,89 @@
+import os
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterator, List
+
+# --- Configuration ---
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_FORMATS = {"tar": "application/x-tar", "zip": "application/zip"}
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)  # earliest timestamp a zip entry can hold
+
+class _ChunkSink:
+    """Write-only file object that collects what zipfile writes until the generator drains it."""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _read_chunks(f, size: int) -> Iterator[bytes]:
+    """Yields exactly `size` bytes of `f`, zero-padded if the file shrank while being read."""
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(EXPORT_CHUNK_SIZE, remaining))
+        if not chunk:
+            yield b"\0" * remaining
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+def iter_tar(paths: List[Path]) -> Iterator[bytes]:
+    """Streams an uncompressed tar of `paths`, one file chunk at a time.
+
+    Headers are written by hand so no member is ever buffered whole. Each member's size is taken
+    when the file is opened, so a capture that grows during the export is cut at that size.
+    """
+    for path in paths:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            continue
+        with f:
+            st = os.fstat(f.fileno())
+            info = tarfile.TarInfo(path.name)
+            info.size, info.mtime, info.mode = st.st_size, int(st.st_mtime), 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            yield from _read_chunks(f, st.st_size)
+            if st.st_size % tarfile.BLOCKSIZE:
+                yield b"\0" * (tarfile.BLOCKSIZE - st.st_size % tarfile.BLOCKSIZE)
+    yield b"\0" * (tarfile.BLOCKSIZE * 2)
+
+def iter_zip(paths: List[Path]) -> Iterator[bytes]:
+    """Streams a stored (uncompressed) zip of `paths`, using data descriptors instead of seeking back."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for path in paths:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                st = os.fstat(f.fileno())
+                info = zipfile.ZipInfo(path.name, max(time.localtime(st.st_mtime)[:6], ZIP_EPOCH))
+                info.file_size = st.st_size
+                with archive.open(info, "w", force_zip64=st.st_size >= zipfile.ZIP64_LIMIT) as member:
+                    for chunk in _read_chunks(f, st.st_size):
+                        member.write(chunk)
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+def iter_archive(paths: List[Path], fmt: str) -> Iterator[bytes]:
+    chunks = iter_tar(paths) if fmt == "tar" else iter_zip(paths)
+    return (chunk for chunk in chunks if chunk)
@@ -0,0 +1,451 @@
+import base64
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from pathlib import Path
+from collections import defaultdict
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from pcap_meta import parse_capture
+
+# --- Configuration ---
+HANDSHAKE_SUFFIX = ".pcap"
+FULL_RESCAN_INTERVAL = 60.0  # seconds; catches captures appended in place, which leave the directory mtime alone
+DIR_MTIME_SETTLE_NS = 1_000_000_000  # a directory mtime this fresh may still hide a same-tick write
+HASH_CHUNK_SIZE = 64 * 1024
+MAX_TOMBSTONES = 10_000  # removals remembered for sync clients; a cursor older than the oldest kept gets a full resync
+BSSID_IN_NAME = re.compile(r"_([0-9a-fA-F]{12})\.pcap$")  # pwnagotchi names captures <essid>_<bssid>.pcap
+
+SORT_KEYS = {
+    "name": lambda h: (h["name"],),
+    "mtime": lambda h: (h["timestamp"], h["name"]),
+    "size": lambda h: (h["size_kb"], h["name"]),
+}
+
+logger = logging.getLogger(__name__)
+
+def bssid_from_name(name: str) -> Optional[str]:
+    match = BSSID_IN_NAME.search(name)
+    if match is None:
+        return None
+    raw = match.group(1).lower()
+    return ":".join(raw[i:i + 2] for i in range(0, 12, 2))
+
+def make_etag(mtime_ns: int, size: int) -> str:
+    """Strong ETag for a capture; it changes whenever the file is rewritten or grows."""
+    return f'"{mtime_ns:x}-{size:x}"'
+
+def encode_cursor(sort: str, key: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode()
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    """Returns the sort key stored in a cursor. Raises ValueError for a cursor from another sort or a bad one."""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(value, list) or not value or value[0] != sort:
+        raise ValueError("Invalid cursor for this sort order")
+    return tuple(value[1:])
+
+class HandshakeIndex:
+    """In-memory index of the capture files in a handshake directory.
+
+    refresh() only lists the directory when its mtime moved (a file was added, removed or
+    renamed) and only stats names it has not seen before. Every FULL_RESCAN_INTERVAL seconds
+    all entries are stat-ed again to pick up captures that grew in place.
+
+    refresh() blocks on filesystem calls and is meant to run in a worker thread; it is
+    serialised internally, while listing() can be read from the event loop at any time.
+
+    With a `cache_path`, content hashes and parsed capture metadata survive restarts: files whose
+    mtime and size are unchanged are neither hashed nor parsed again.
+    """
+    def __init__(self, directory: Path, full_rescan_interval: float = FULL_RESCAN_INTERVAL, cache_path: Optional[Path] = None):
+        self.directory = directory
+        self.full_rescan_interval = full_rescan_interval
+        self.cache_path = cache_path
+        self._cache_changes = 0  # bumped whenever a hash or parsed metadata is added
+        self._cache_saved_changes = 0
+        self._cache_saved_at = 0.0
+        self._cache_save_failed = False
+        self._stats: Dict[str, Tuple[int, int]] = {}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._listing: List[Dict[str, Any]] = []
+        self._dir_mtime_ns: Optional[int] = None
+        self._last_full_scan: Optional[float] = None
+        self._sorted: Dict[str, Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Tuple]]] = {}
+        self._lock = threading.Lock()
+        # Change log for sync clients: every add/update/removal gets the next sequence number.
+        self.epoch = format(time.time_ns(), "x")  # cursors from an earlier process are not comparable
+        self._seq = 0
+        self._entry_seq: Dict[str, int] = {}
+        self._removed_seq: Dict[str, int] = {}  # in removal order, so the oldest tombstone comes first
+        self._pruned_seq = 0  # sequence number of the newest tombstone dropped
+        self._hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._unreadable: Dict[str, Tuple[int, int]] = {}  # captures hashing failed on, until their mtime/size change
+        # Parsed capture metadata keyed by content hash, and which hash each entry was annotated from.
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._annotated: Dict[str, str] = {}
+        self._scans = 0
+        self._last_scan_ms = 0.0
+        self._max_scan_ms = 0.0
+
+    def listing(self) -> List[Dict[str, Any]]:
+        """Returns the indexed captures sorted by name. The list is shared and must not be mutated."""
+        return self._listing
+
+    def query(self, sort: str = "mtime", descending: bool = True, prefix: str = "", since: Optional[float] = None,
+              until: Optional[float] = None, min_size_kb: Optional[float] = None, max_size_kb: Optional[float] = None,
+              cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """Returns one page of captures matching the filters, in `sort` order.
+
+        Pages are keyed by the sort key of their last entry rather than an offset, so captures
+        arriving between requests neither repeat nor skip rows. Raises ValueError for a bad cursor.
+        """
+        entries, keys = self._sorted_by(sort)
+        if cursor is None:
+            position = len(entries) - 1 if descending else 0
+        else:
+            after = decode_cursor(cursor, sort)
+            try:
+                position = bisect.bisect_left(keys, after) - 1 if descending else bisect.bisect_right(keys, after)
+            except TypeError:
+                raise ValueError("Invalid cursor for this sort order")
+        step = -1 if descending else 1
+        items: List[Dict[str, Any]] = []
+        last = None
+        while 0 <= position < len(entries) and len(items) < limit:
+            h = entries[position]
+            position += step
+            if prefix and not h["name"].startswith(prefix): continue
+            if since is not None and h["timestamp"] < since: continue
+            if until is not None and h["timestamp"] > until: continue
+            if min_size_kb is not None and h["size_kb"] < min_size_kb: continue
+            if max_size_kb is not None and h["size_kb"] > max_size_kb: continue
+            items.append(h)
+            last = keys[position - step]
+        has_more = len(items) == limit and 0 <= position < len(entries)
+        return {"items": items, "next_cursor": encode_cursor(sort, last) if has_more else None}
+
+    def _sorted_by(self, sort: str) -> Tuple[List[Dict[str, Any]], List[Tuple]]:
+        """Returns the listing sorted ascending by SORT_KEYS[sort], with the keys, cached per listing."""
+        listing = self._listing
+        cached = self._sorted.get(sort)
+        if cached is None or cached[0] is not listing:
+            key = SORT_KEYS[sort]
+            entries = sorted(listing, key=key)
+            cached = self._sorted[sort] = (listing, entries, [key(h) for h in entries])
+        return cached[1], cached[2]
+
+    def scan_stats(self) -> Dict[str, Any]:
+        """Returns how many directory scans ran and how long they took."""
+        return {
+            "entries": len(self._listing),
+            "scans": self._scans,
+            "last_scan_ms": round(self._last_scan_ms, 3),
+            "max_scan_ms": round(self._max_scan_ms, 3),
+        }
+
+    def refresh(self) -> bool:
+        """Brings the index up to date with the directory. Returns True if anything changed."""
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                return self._refresh()
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._scans += 1
+                self._last_scan_ms = elapsed_ms
+                self._max_scan_ms = max(self._max_scan_ms, elapsed_ms)
+
+    def _refresh(self) -> bool:
+        try:
+            dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            changed = bool(self._entries)
+            for name in list(self._stats): self._remove(name)
+            self._dir_mtime_ns = None
+            if changed: self._listing = []
+            return changed
+        now = time.monotonic()
+        full = self._last_full_scan is None or now - self._last_full_scan >= self.full_rescan_interval
+        if dir_mtime_ns == self._dir_mtime_ns and not full:
+            return False
+
+        changed = False
+        seen = set()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith(".") or not name.endswith(HANDSHAKE_SUFFIX) or not entry.is_file():
+                    continue
+                if name in self._stats and not full:
+                    seen.add(name)
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                seen.add(name)
+                if self._stats.get(name) != (st.st_mtime_ns, st.st_size):
+                    self._set(name, st)
+                    changed = True
+        for name in self._stats.keys() - seen:
+            self._remove(name)
+            changed = True
+
+        # Leave a just-modified directory unrecorded so the next refresh lists it again.
+        self._dir_mtime_ns = dir_mtime_ns if time.time_ns() - dir_mtime_ns > DIR_MTIME_SETTLE_NS else None
+        if full: self._last_full_scan = now
+        if changed:
+            self._listing = [self._entries[name] for name in sorted(self._entries)]
+        return changed
+
+    def _set(self, name: str, st: os.stat_result):
+        self._stats[name] = (st.st_mtime_ns, st.st_size)
+        self._entries[name] = self._make_entry(name, st)
+        self._annotated.pop(name, None); self._unreadable.pop(name, None)
+        self._seq += 1
+        self._entry_seq[name] = self._seq
+        self._removed_seq.pop(name, None)
+
+    def _remove(self, name: str):
+        del self._stats[name]; del self._entries[name]; del self._entry_seq[name]
+        self._hashes.pop(name, None); self._annotated.pop(name, None); self._unreadable.pop(name, None)
+        self._seq += 1
+        self._removed_seq[name] = self._seq
+        if len(self._removed_seq) > MAX_TOMBSTONES:
+            self._pruned_seq = self._removed_seq.pop(next(iter(self._removed_seq)))
+
+    def changes(self, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """Returns captures added, changed or removed after `cursor`, oldest change first.
+
+        Each present capture carries its size, mtime, ETag and SHA-256 so a collector can fetch
+        only what it lacks. A missing cursor, one from before a restart, or one older than the
+        oldest removal still remembered (see MAX_TOMBSTONES) returns the whole index with
+        "reset": true; the client should then drop whatever the listing no longer has. Blocks on
+        hashing, so run it in a worker thread.
+        """
+        since, reset = 0, True
+        if cursor:
+            epoch, _, seq = cursor.partition(":")
+            seq, _, resyncing = seq.partition(":")  # a ":full" suffix continues the pages of a full resync
+            if epoch == self.epoch:
+                try:
+                    since, reset = int(seq), bool(resyncing)
+                except ValueError:
+                    raise ValueError("Invalid cursor")
+        with self._lock:
+            if not reset and since < self._pruned_seq:
+                since, reset = 0, True
+            pending = sorted([(seq, name, True) for name, seq in self._entry_seq.items() if seq > since] +
+                             [(seq, name, False) for name, seq in self._removed_seq.items() if seq > since and not reset])
+            head = self._seq
+        changes = []
+        for seq, name, present in pending[:limit]:
+            if not present:
+                changes.append({"name": name, "deleted": True})
+                continue
+            described = self.describe(name)
+            changes.append(described if described is not None else {"name": name, "deleted": True})
+        more = len(pending) > limit
+        last = pending[limit - 1][0] if more else head
+        cursor = f"{self.epoch}:{last}:full" if reset and more else f"{self.epoch}:{last}"
+        return {"cursor": cursor, "reset": reset, "more": more, "changes": changes}
+
+    def describe(self, name: str) -> Optional[Dict[str, Any]]:
+        """Size, mtime, ETag and SHA-256 of one capture, hashing it only if it changed since last time.
+
+        Returns None if the file is gone. Blocks on file I/O.
+        """
+        try:
+            f = open(self.directory / name, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            key = (st.st_mtime_ns, st.st_size)
+            cached = self._hashes.get(name)
+            if cached is not None and cached[0] == key:
+                digest = cached[1]
+            else:
+                sha = hashlib.sha256()
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    sha.update(chunk)
+                digest = sha.hexdigest()
+                if name in self._stats:
+                    self._hashes[name] = (key, digest)
+                    self._cache_changes += 1
+        return {"name": name, "size": st.st_size, "mtime": st.st_mtime, "etag": make_etag(*key), "sha256": digest}
+
+    def hash_pending(self, limit: int) -> int:
+        """Hashes up to `limit` captures whose content hash is missing or stale. Returns how many it tried.
+
+        A capture that cannot be read is logged and skipped until its mtime or size changes.
+        """
+        pending = [name for name, key in list(self._stats.items())
+                   if self._hashes.get(name, (None,))[0] != key and self._unreadable.get(name) != key]
+        for name in pending[:limit]:
+            try:
+                self.describe(name)
+            except OSError as e:
+                key = self._stats.get(name)
+                if key is not None: self._unreadable[name] = key
+                logger.warning(f"Could not hash capture {name}; skipping it until it changes: {e}")
+        return min(len(pending), limit)
+
+    def annotate_pending(self, limit: int) -> int:
+        """Parses up to `limit` hashed captures not yet annotated and merges bssid, essid, channel,
+        EAPOL and PMKID details into their listing entries. Returns how many it annotated.
+
+        Results are cached by content hash, so duplicates and re-indexed files are parsed once.
+        Only captures the hasher has reached are annotated. Blocks on file I/O.
+        """
+        stats = dict(self._stats)
+        pending = [(name, key, digest) for name, (key, digest) in list(self._hashes.items())
+                   if stats.get(name) == key and self._annotated.get(name) != digest]
+        pending = pending[:limit]
+        for name, key, digest in pending:
+            if digest in self._meta:
+                continue
+            try:
+                self._meta[digest] = parse_capture(self.directory / name)
+            except FileNotFoundError:
+                continue
+            except (OSError, struct.error, ValueError) as e:
+                logger.warning(f"Could not parse capture {name}: {e}")
+                self._meta[digest] = {}
+            self._cache_changes += 1
+        if not pending:
+            return 0
+        with self._lock:
+            for name, key, digest in pending:
+                if digest not in self._meta or self._stats.get(name) != key:
+                    continue
+                # Drop the cracked flag so it is re-evaluated against the parsed BSSID/ESSID.
+                entry = {key: value for key, value in self._entries[name].items() if key != "cracked"}
+                self._entries[name] = {**entry, **self._meta[digest]}
+                self._annotated[name] = digest
+            self._listing = [self._entries[name] for name in sorted(self._entries)]
+            live = {digest for name, (key, digest) in self._hashes.items() if name in self._stats}
+            if len(self._meta) > len(live):
+                self._meta = {digest: meta for digest, meta in self._meta.items() if digest in live}
+        return len(pending)
+
+    def annotate_cracked(self, cracked: Callable[[Dict[str, Any]], bool], recheck: bool = False) -> int:
+        """Sets each entry's "cracked" flag from `cracked(entry)`. Returns how many flags changed.
+
+        Only entries without a flag are evaluated, unless `recheck` is set because the potfiles changed.
+        """
+        changed = 0
+        with self._lock:
+            for name, entry in list(self._entries.items()):
+                if "cracked" in entry and not recheck:
+                    continue
+                value = cracked(entry)
+                if entry.get("cracked") is not value:
+                    self._entries[name] = {**entry, "cracked": value}
+                    changed += 1
+            if changed:
+                self._listing = [self._entries[name] for name in sorted(self._entries)]
+        return changed
+
+    def load_cache(self):
+        """Restores content hashes and parsed metadata saved by save_cache(). Blocks on file I/O."""
+        if self.cache_path is None:
+            return
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+            hashes = {name: ((mtime_ns, size), digest) for name, (mtime_ns, size, digest) in cache["hashes"].items()}
+            meta = dict(cache["meta"])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable capture cache {self.cache_path}: {e}")
+            return
+        self._hashes.update(hashes)
+        self._meta.update(meta)
+        logger.info(f"Loaded cached hashes for {len(hashes)} captures.")
+
+    def save_cache(self, min_interval: float = 0.0):
+        """Writes content hashes and parsed metadata of the indexed captures, if they changed and at
+        least `min_interval` seconds passed since the last save. Blocks on file I/O.
+
+        A failed write is logged, not raised; the changes stay pending and are retried next time.
+        """
+        changes = self._cache_changes
+        if self.cache_path is None or changes == self._cache_saved_changes or time.monotonic() - self._cache_saved_at < min_interval:
+            return
+        self._cache_saved_at = time.monotonic()
+        stats = dict(self._stats)
+        hashes = {name: [*key, digest] for name, (key, digest) in list(self._hashes.items()) if stats.get(name) == key}
+        digests = {digest for _, _, digest in hashes.values()}
+        meta = {digest: value for digest, value in list(self._meta.items()) if digest in digests}
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump({"hashes": hashes, "meta": meta}, f, separators=(",", ":"))
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            if self._cache_save_failed:
+                logger.debug(f"Could not save capture cache {self.cache_path}: {e}")
+            else:
+                logger.warning(f"Could not save capture cache {self.cache_path}; retrying on later passes: {e}")
+            self._cache_save_failed = True
+            return
+        self._cache_saved_changes = changes
+        self._cache_save_failed = False
+
+    def duplicates(self) -> Dict[str, Any]:
+        """Groups captures with identical content, and captures of the same BSSID.
+
+        Content groups only cover captures the background hasher has reached ("pending" counts
+        the rest, "unreadable" those it could not read). Same-BSSID files usually hold different
+        frames, so they are reported only.
+        """
+        stats = dict(self._stats)
+        unreadable = sum(1 for name, key in list(self._unreadable.items()) if stats.get(name) == key)
+        by_content = defaultdict(list)
+        for name, (key, digest) in list(self._hashes.items()):
+            if stats.get(name) == key: by_content[digest].append(name)
+        by_bssid = defaultdict(list)
+        for name in stats:
+            bssid = self._entries.get(name, {}).get("bssid") or bssid_from_name(name)
+            if bssid is not None: by_bssid[bssid].append(name)
+        hashed = sum(len(names) for names in by_content.values())
+        return {
+            "hashed": hashed,
+            "pending": len(stats) - hashed - unreadable,
+            "unreadable": unreadable,
+            "by_content": [{"sha256": digest, "names": sorted(names)} for digest, names in sorted(by_content.items()) if len(names) > 1],
+            "by_bssid": [{"bssid": bssid, "names": sorted(names)} for bssid, names in sorted(by_bssid.items()) if len(names) > 1],
+        }
+
+    def dedupe(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Deletes all but the oldest file of each identical-content group. Blocks on file I/O."""
+        removed = []
+        for group in self.duplicates()["by_content"]:
+            names = sorted(group["names"], key=lambda name: (self._stats.get(name, (0, 0))[0], name))
+            for name in names[1:]:
+                if not dry_run:
+                    try:
+                        os.remove(self.directory / name)
+                    except FileNotFoundError:
+                        continue
+                removed.append(name)
+        if removed and not dry_run:
+            logger.info(f"Removed {len(removed)} duplicate handshake captures.")
+        return {"dry_run": dry_run, "removed": removed}
+
+    @staticmethod
+    def _make_entry(name: str, st: os.stat_result) -> Dict[str, Any]:
+        return {"name": name, "timestamp": st.st_mtime, "size_kb": round(st.st_size / 1024, 2)}
@@ -0,0 +1,138 @@
+import time
+from typing import Dict, List, Any, Optional, Iterable
+
+# --- Configuration ---
+TOPICS = ("status", "peers", "handshakes")
+TOPIC_SOURCES = {"status": "data", "peers": "peers", "handshakes": "handshakes"}  # topic -> snapshot source
+VOLATILE_FIELDS = frozenset({"timestamp"})  # change on every poll without anything new having happened
+HEARTBEAT_INTERVAL = 30.0  # seconds between frames sent to idle clients
+POLL_INTERVAL_MIN = 1.0  # seconds; used while snapshots keep changing
+POLL_INTERVAL_MAX = 15.0  # seconds; reached after a run of idle or failed polls
+IDLE_BACKOFF = 1.5
+FAILURE_BACKOFF = 2.0
+
+def _diff_handshakes(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Diffs two handshake listings by filename. Updated entries are reported as added."""
+    if old is new:
+        return {}
+    old_by_name = {h["name"]: h for h in old}
+    new_by_name = {h["name"]: h for h in new}
+    added = [h for name, h in new_by_name.items() if old_by_name.get(name) != h]
+    removed = [name for name in old_by_name if name not in new_by_name]
+    if not added and not removed:
+        return {}
+    return {"added": added, "removed": removed}
+
+def diff_snapshots(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the changes that turn snapshot `old` into `new`, or {} if they are identical.
+
+    Top-level fields are replaced whole ("set"/"unset"); the handshake list is diffed per file
+    because it is the only part that grows large.
+    """
+    if old is new:
+        return {}
+    patch: Dict[str, Any] = {}
+    changed = {k: v for k, v in new.items() if k != "handshakes" and (k not in old or old[k] != v)}
+    removed = [k for k in old if k not in new]
+    if changed: patch["set"] = changed
+    if removed: patch["unset"] = removed
+    if "handshakes" in new:
+        if "handshakes" in old:
+            handshakes = _diff_handshakes(old["handshakes"], new["handshakes"])
+        else:
+            handshakes = {"added": new["handshakes"], "removed": []}
+        if handshakes: patch["handshakes"] = handshakes
+    return patch
+
+def parse_topics(topics: Iterable[Any]) -> List[str]:
+    """Keeps the known topic names from a client request, in TOPICS order."""
+    requested = {topic for topic in topics if isinstance(topic, str)}
+    return [topic for topic in TOPICS if topic in requested]
+
+def topic_sources(topics: Iterable[str]) -> List[str]:
+    return [TOPIC_SOURCES[topic] for topic in topics]
+
+def split_topics(snapshot: Dict[str, Any], topics: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Splits a composed snapshot into per-topic parts; topics missing from the snapshot are left out."""
+    parts = {}
+    for topic in topics:
+        if topic == "status":
+            parts[topic] = {k: v for k, v in snapshot.items() if k not in ("peers", "handshakes")}
+        elif topic in snapshot:
+            parts[topic] = {topic: snapshot[topic]}
+    return parts
+
+class SnapshotFeed:
+    """Sequenced snapshot stream for one topic, shared by every /ws client subscribed to it.
+
+    Clients receive one {"type": "snapshot"} message and then {"type": "patch"} messages, each
+    carrying the topic and the sequence number it applies on top of ("base"). A client that sees
+    a gap sends {"type": "resync", "topic": ...} and gets a fresh snapshot.
+
+    Snapshots that differ only in VOLATILE_FIELDS are not published; instead, idle clients get
+    a frame every heartbeat_interval seconds, a {"type": "heartbeat"} if nothing changed at all.
+    """
+    def __init__(self, topic: str, heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        self.topic = topic
+        self.seq = 0
+        self.current: Optional[Dict[str, Any]] = None
+        self.heartbeat_interval = heartbeat_interval
+        self.stats = {"published": 0, "unchanged": 0, "heartbeats": 0}
+        self.changed = False  # whether the last advance() published a real change
+        self._last_sent = 0.0
+
+    def reset(self):
+        """Forgets the current snapshot so the next client starts from fresh data. The sequence keeps counting."""
+        self.current = None
+
+    def snapshot_message(self) -> Dict[str, Any]:
+        return {"type": "snapshot", "topic": self.topic, "seq": self.seq, "data": self.current}
+
+    def advance(self, snapshot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Makes `snapshot` current. Returns the patch message for clients, or None if nothing changed."""
+        now = time.monotonic()
+        self.changed = False
+        if self.current is None:
+            self.current, self._last_sent = snapshot, now
+            self.seq += 1
+            self.stats["published"] += 1
+            self.changed = True
+            return self.snapshot_message()
+        patch = diff_snapshots(self.current, snapshot)
+        if set(patch) <= {"set"} and VOLATILE_FIELDS.issuperset(patch.get("set", ())):
+            if now - self._last_sent < self.heartbeat_interval:
+                self.stats["unchanged"] += 1
+                return None
+            self.stats["heartbeats"] += 1
+            if not patch:
+                self._last_sent = now
+                return {"type": "heartbeat", "topic": self.topic, "seq": self.seq}
+        else:
+            self.stats["published"] += 1
+            self.changed = True
+        self.current, self._last_sent = snapshot, now
+        self.seq += 1
+        return {"type": "patch", "topic": self.topic, "seq": self.seq, "base": self.seq - 1, **patch}
+
+class AdaptiveInterval:
+    """Poll interval that drops to the floor while data changes and backs off exponentially otherwise.
+
+    Failed polls back off faster than idle ones, so a dead upstream API is retried at the ceiling
+    rate instead of every tick.
+    """
+    def __init__(self, floor: float = POLL_INTERVAL_MIN, ceiling: float = POLL_INTERVAL_MAX):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.current = floor
+
+    def reset(self):
+        self.current = self.floor
+
+    def changed(self):
+        self.current = self.floor
+
+    def idle(self):
+        self.current = min(self.current * IDLE_BACKOFF, self.ceiling)
+
+    def failed(self):
+        self.current = min(self.current * FAILURE_BACKOFF, self.ceiling)
@@ -1,17 +1,29 @@
 import asyncio
-import json
 import logging
+import os
+import stat
 import subprocess
+import time
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Set
 
 import toml
 import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Query
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 
-from pwnagotchi_api import get_pwnagotchi_data, get_peers, get_handshakes
+from pwnagotchi_api import get_snapshot, get_handshakes, open_client, close_client, handshake_index, source_caches
+from handshake_index import SORT_KEYS, make_etag
+from handshake_export import EXPORT_FORMATS, iter_archive
+from serializers import Frame, FastJSONResponse, decode_frame, encode_frame, negotiate_subprotocol
+from ws_compression import TunedWebSocketProtocol, get_compression_stats
+from live_feed import SnapshotFeed, AdaptiveInterval, TOPICS, parse_topics, split_topics, topic_sources
+from telemetry import TelemetryStore, sample_from_snapshot
+from snapshot_archive import SnapshotArchive
+from capture_analytics import CaptureAnalytics
+from potfile_index import PotfileIndex, potfile_paths
 
 # --- Configuration ---
 LOG_LEVEL = logging.INFO
@@ -20,18 +32,158 @@ PORT = 8080
 HANDSHAKE_DIR = Path("/root/handshakes/")
 CONFIG_PATH = Path("/etc/pwnagotchi/config.toml")
 PLUGIN_DIRS = [ Path("/usr/local/share/pwnagotchi/custom-plugins/"), Path("/usr/share/pwnagotchi/plugins/") ]
+CLIENT_QUEUE_SIZE = 8  # at least len(TOPICS); frames buffered per WebSocket client before SLOW_CLIENT_POLICY applies
+SLOW_CLIENT_POLICY = "coalesce"  # "drop", "coalesce" or "disconnect"
+HASH_INTERVAL = 30  # seconds between background hashing passes over new or changed captures
+HASH_BATCH_SIZE = 200  # captures hashed per pass, so a large backlog is spread out on a Pi Zero
+AUTO_DEDUPE = False  # delete identical-content duplicates after each hashing pass
+CAPTURE_CACHE_SAVE_INTERVAL = 60  # seconds; how often the hash/metadata cache is saved while a backlog is worked through
+TELEMETRY_INTERVAL = 2.0  # seconds between device stat samples kept for /api/history while a dashboard is open
+TELEMETRY_IDLE_INTERVAL: Optional[float] = 10.0  # seconds between samples while no dashboard is connected; None pauses sampling (and the /data polling it costs) until one connects
+TELEMETRY_RETRY_MAX = 60.0  # seconds; ceiling of the sampler's backoff while the Pwnagotchi API is down
 
 logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
-app = FastAPI(title="Pwnagotchi C&C API", version="4.0.0")
+app = FastAPI(title="Pwnagotchi C&C API", version="4.0.0", default_response_class=FastJSONResponse)
+
+class ClientConnection:
+    """A /ws client with its subscribed topics, frame encoding and own bounded queue of pre-encoded frames."""
+    def __init__(self, websocket: WebSocket, queue_size: int, encoding: str = "json"):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
 
 class ConnectionManager:
-    def __init__(self): self.active_connections: List[WebSocket] = []
-    async def connect(self, websocket: WebSocket): await websocket.accept(); self.active_connections.append(websocket)
-    def disconnect(self, websocket: WebSocket): self.active_connections.remove(websocket)
-    async def broadcast(self, message: str):
-        for connection in self.active_connections: await connection.send_text(message)
-manager = ConnectionManager()
+    """Fans frames out to every client concurrently; a stalled client only backs up its own queue.
+
+    When a client's queue is full, SLOW_CLIENT_POLICY decides what happens: "drop" discards the
+    new frame (the client notices the sequence gap and asks to resync), "coalesce" replaces the
+    backlog with one fresh snapshot per subscribed topic, and "disconnect" closes the socket.
+
+    Messages are encoded at most once per encoding per broadcast: JSON text frames by default,
+    or binary frames for clients that negotiated a subprotocol from WS_SUBPROTOCOLS.
+    """
+    def __init__(self, snapshot_message: Callable[[str], Optional[Dict[str, Any]]], queue_size: int = CLIENT_QUEUE_SIZE, policy: str = SLOW_CLIENT_POLICY):
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.snapshot_message = snapshot_message
+        self.queue_size = queue_size
+        self.policy = policy
+        self.stats = {"frames_sent": 0, "frames_dropped": 0, "coalesced": 0, "disconnected": 0}
+        self._clients_waiter: Optional[asyncio.Future] = None
+        self._closing: Set[asyncio.Task] = set()  # the loop only keeps weak references to tasks
+
+    async def connect(self, websocket: WebSocket):
+        subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        client = ClientConnection(websocket, self.queue_size, subprotocol or "json")
+        client.sender = asyncio.create_task(self._drain(client))
+        self.active_connections[websocket] = client
+        if self._clients_waiter is not None and not self._clients_waiter.done(): self._clients_waiter.set_result(None)
+
+    async def wait_for_clients(self):
+        """Returns once at least one client is connected."""
+        while not self.active_connections:
+            if self._clients_waiter is None or self._clients_waiter.done():
+                self._clients_waiter = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._clients_waiter)  # shared by every waiting loop; one being cancelled must not wake the rest
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.active_connections.pop(websocket, None)
+        if client is not None and client.sender is not asyncio.current_task(): client.sender.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: List[str]) -> List[str]:
+        """Adds topics to a client's subscription and returns the ones it did not have yet."""
+        client = self.active_connections.get(websocket)
+        if client is None: return []
+        added = [topic for topic in topics if topic not in client.topics]
+        client.topics.update(added)
+        return added
+
+    def unsubscribe(self, websocket: WebSocket, topics: List[str]):
+        client = self.active_connections.get(websocket)
+        if client is not None: client.topics.difference_update(topics)
+
+    def subscribed(self, websocket: WebSocket) -> List[str]:
+        client = self.active_connections.get(websocket)
+        return [topic for topic in TOPICS if client is not None and topic in client.topics]
+
+    def active_topics(self) -> List[str]:
+        """Topics at least one client is subscribed to."""
+        active = set().union(*(client.topics for client in self.active_connections.values()))
+        return [topic for topic in TOPICS if topic in active]
+
+    def send(self, websocket: WebSocket, message: Dict[str, Any]):
+        """Queues a message for one client without waiting for it to be written."""
+        client = self.active_connections.get(websocket)
+        if client is not None: self._enqueue(client, message, {})
+
+    async def broadcast(self, message: Dict[str, Any], topic: Optional[str] = None):
+        """Queues a message for every client, or only for subscribers of `topic`."""
+        frames: Dict[Any, Optional[Frame]] = {}  # each frame encoded at most once per broadcast, and only if some client needs it
+        for client in list(self.active_connections.values()):
+            if topic is None or topic in client.topics: self._enqueue(client, message, frames)
+
+    def _encode(self, message: Optional[Dict[str, Any]], encoding: str, frames: Dict[Any, Optional[Frame]], key: Any) -> Optional[Frame]:
+        if (key, encoding) not in frames:
+            frames[key, encoding] = encode_frame(message, encoding) if message is not None else None
+        return frames[key, encoding]
+
+    def _enqueue(self, client: ClientConnection, message: Dict[str, Any], frames: Dict[Any, Optional[Frame]]):
+        frame = self._encode(message, client.encoding, frames, None)
+        try:
+            client.queue.put_nowait(frame)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.policy == "disconnect":
+            self.stats["disconnected"] += 1
+            self.disconnect(client.websocket)
+            task = asyncio.create_task(self._close(client.websocket, 1013))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+        elif self.policy == "coalesce":
+            snapshots = [self._encode(self.snapshot_message(topic), client.encoding, frames, topic) for topic in client.topics]
+            snapshots = [snapshot for snapshot in snapshots if snapshot is not None]
+            while not client.queue.empty(): client.queue.get_nowait()
+            self.stats["coalesced"] += 1
+            for queued in snapshots or [frame]: client.queue.put_nowait(queued)
+        else:
+            self.stats["frames_dropped"] += 1
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception as e:
+            logger.debug(f"Could not close WebSocket client: {e}")
+
+    async def _drain(self, client: ClientConnection):
+        try:
+            while True:
+                frame = await client.queue.get()
+                if isinstance(frame, bytes): await client.websocket.send_bytes(frame)
+                else: await client.websocket.send_text(frame)
+                self.stats["frames_sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Dropping WebSocket client after failed send: {e}")
+            self.disconnect(client.websocket)
+
+def snapshot_message(topic: str) -> Optional[Dict[str, Any]]:
+    feed = feeds[topic]
+    return feed.snapshot_message() if feed.current is not None else None
+
+feeds = {topic: SnapshotFeed(topic) for topic in TOPICS}
+poll_interval = AdaptiveInterval()
+telemetry_interval = AdaptiveInterval(TELEMETRY_INTERVAL, TELEMETRY_RETRY_MAX)
+manager = ConnectionManager(snapshot_message)
+telemetry = TelemetryStore()
+archive = SnapshotArchive()
+capture_analytics = CaptureAnalytics()
+potfiles = PotfileIndex(potfile_paths())
+background_tasks: List[asyncio.Task] = []
 
 # --- Helper Functions ---
 def restart_pwnagotchi_service():
@@ -46,17 +198,136 @@ def restart_pwnagotchi_service():
 # --- API Endpoints ---
 @app.get("/api/data")
 async def get_data():
-    return await get_pwnagotchi_data()
+    return await source_caches["data"].get()
 
-@app.get("/api/handshakes/{filename:path}")
-async def download_handshake(filename: str):
-    # ... (no changes)
+@app.get("/api/metrics")
+async def get_metrics():
+    """Reports internal timings for diagnosing load on the device."""
+    return {
+        "handshake_scan": handshake_index.scan_stats(),
+        "websocket": {"clients": len(manager.active_connections), **manager.stats},
+        "compression": get_compression_stats(),
+        "feed": {"poll_interval": poll_interval.current, **{topic: {"seq": feed.seq, **feed.stats} for topic, feed in feeds.items()}},
+        "archive": archive.stats(),
+        "potfiles": potfiles.stats(),
+    }
+
+@app.get("/api/history")
+async def get_history(resolution: str = "minute", since: Optional[float] = None, until: Optional[float] = None,
+                      bucket: Optional[float] = Query(None, gt=0), field: List[str] = Query([])):
+    """Returns recorded device stats: raw samples, or min/mean/max per minute or hour.
+
+    With `bucket` (seconds), returns min/mean/max per bucket over [since, until] instead,
+    defaulting to the last 24 hours; `field` limits which stats are included.
+    """
+    try:
+        if bucket is not None:
+            until = time.time() if until is None else until
+            since = until - 86400 if since is None else since
+            if since > until: raise ValueError("since must not be after until")
+            return telemetry.aggregate(since, until, bucket, field)
+        return telemetry.query(resolution, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/archive")
+async def get_archive(since: Optional[float] = None, until: Optional[float] = None, column: List[str] = Query([]),
+                      limit: int = Query(1000, ge=1, le=10000)):
+    """Reads archived per-epoch stats within [since, until]; pass the returned next_since to continue."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, archive.query, since, until, column, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/handshakes")
+async def list_handshakes(sort: str = "mtime", order: str = "desc", prefix: str = "", since: Optional[float] = None,
+                          until: Optional[float] = None, min_size_kb: Optional[float] = None, max_size_kb: Optional[float] = None,
+                          cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """Pages through captured handshakes; pass the returned next_cursor to get the following page."""
+    if sort not in SORT_KEYS: raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SORT_KEYS)}")
+    if order not in ("asc", "desc"): raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    await get_handshakes()
+    try:
+        return handshake_index.query(sort, order == "desc", prefix, since, until, min_size_kb, max_size_kb, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/handshakes/export")
+async def export_handshakes(fmt: str = Query("tar", alias="format"), since: Optional[float] = None, name: List[str] = Query([])):
+    """Streams captures as one tar or zip: all of them, those modified since `since`, or the given `name`s."""
+    if fmt not in EXPORT_FORMATS: raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    await get_handshakes()
+    entries = handshake_index.listing()
+    if since is not None: entries = [h for h in entries if h["timestamp"] >= since]
+    if name:
+        wanted = set(name)
+        entries = [h for h in entries if h["name"] in wanted]
+    paths = [handshake_index.directory / h["name"] for h in entries]
+    return StreamingResponse(iter_archive(paths, fmt), media_type=EXPORT_FORMATS[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="handshakes.{fmt}"'})
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*": return True
+    return any(tag.strip()[2:] == etag if tag.strip().startswith("W/") else tag.strip() == etag for tag in if_none_match.split(","))
+
+@app.get("/api/handshakes/analytics")
+async def get_capture_analytics(hours: int = Query(24, ge=1, le=24 * 90), top: int = Query(20, ge=1, le=500)):
+    """Reports capture counts per hour, session, channel and ESSID."""
+    await get_handshakes()
+    capture_analytics.update(handshake_index.listing())
+    return capture_analytics.summary(hours, top)
+
+@app.get("/api/handshakes/duplicates")
+async def get_duplicate_handshakes():
+    """Reports captures with identical content and captures of the same BSSID."""
+    return handshake_index.duplicates()
+
+@app.post("/api/handshakes/dedupe")
+async def dedupe_handshakes(dry_run: bool = False):
+    """Deletes identical-content duplicates, keeping the oldest file of each group."""
+    result = await asyncio.get_running_loop().run_in_executor(None, handshake_index.dedupe, dry_run)
+    await get_handshakes()
+    return result
+
+@app.api_route("/api/handshakes/{filename:path}", methods=["GET", "HEAD"])
+async def download_handshake(filename: str, request: Request):
+    """Serves one capture with ETag/Last-Modified validators, 304 revalidation and byte-range resume."""
+    file_path = (HANDSHAKE_DIR / filename).resolve()
+    if HANDSHAKE_DIR.resolve() not in file_path.parents:
+        raise HTTPException(status_code=404, detail="File not found.")
     try:
-        file_path = (HANDSHAKE_DIR / filename).resolve()
-        if not file_path.is_file() or not str(file_path).startswith(str(HANDSHAKE_DIR.resolve())):
-            raise HTTPException(status_code=404, detail="File not found.")
-        return FileResponse(file_path, media_type='application/vnd.tcpdump.pcap', filename=filename)
-    except Exception as e: raise HTTPException(status_code=500, detail="Internal server error")
+        st = await asyncio.get_running_loop().run_in_executor(None, os.stat, file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found.")
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="File not found.")
+    etag = make_etag(st.st_mtime_ns, st.st_size)
+    validators = {"ETag": etag, "Last-Modified": formatdate(st.st_mtime, usegmt=True)}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag): return Response(status_code=304, headers=validators)
+    elif "if-modified-since" in request.headers:
+        try:
+            if int(st.st_mtime) <= parsedate_to_datetime(request.headers["if-modified-since"]).timestamp():
+                return Response(status_code=304, headers=validators)
+        except (TypeError, ValueError):
+            pass
+    # FileResponse answers Range/If-Range requests itself, checked against the ETag set here.
+    return FileResponse(file_path, stat_result=st, headers=validators, media_type='application/vnd.tcpdump.pcap', filename=file_path.name)
+
+@app.get("/api/sync/manifest")
+async def sync_manifest(cursor: Optional[str] = None, limit: int = Query(500, ge=1, le=5000)):
+    """Lists captures changed since `cursor` for incremental mirroring.
+
+    Fetch each listed capture from /api/handshakes/{name}, then pass the returned cursor next
+    time. Keep paging while "more" is true; "reset": true means the mirror should be reconciled
+    against the full list it just received.
+    """
+    await get_handshakes()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, handshake_index.changes, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/config")
 async def get_config_file():
@@ -135,37 +406,153 @@ async def shutdown_system():
         raise HTTPException(status_code=500, detail="Failed to issue shutdown command.")
 
 # --- Background Task, WebSocket, and Static Files ---
+async def publish(data: Dict[str, Any], topics: List[str]) -> bool:
+    """Advances the feed of each topic present in `data` and broadcasts the resulting frames.
+
+    Returns True if any topic published a real change.
+    """
+    changed = False
+    for topic, part in split_topics(data, topics).items():
+        feed = feeds[topic]
+        message = feed.advance(part)
+        if message is not None:
+            await manager.broadcast(message, topic)
+        changed = changed or feed.changed
+    return changed
+
 async def broadcast_updates():
     while True:
-        await asyncio.sleep(2)
+        if not manager.active_connections:
+            # Nobody is watching: stop polling until the next client connects, which fetches fresh data itself.
+            for feed in feeds.values(): feed.reset()
+            logger.info("No WebSocket clients; pausing broadcast loop.")
+            await manager.wait_for_clients()
+            logger.info("WebSocket client connected; resuming broadcast loop.")
+            poll_interval.reset()
+        await asyncio.sleep(poll_interval.current)
         try:
-            data = await get_pwnagotchi_data()
-            if "error" not in data:
-                peers = await get_peers()
-                if "error" not in peers:
-                    data["peers"] = peers
-                handshakes = await get_handshakes()
-                if "error" not in handshakes:
-                    data["handshakes"] = handshakes
-                await manager.broadcast(json.dumps(data))
+            topics = manager.active_topics()
+            for topic in TOPICS:
+                if topic not in topics: feeds[topic].reset()
+            if not topics:
+                poll_interval.idle()
+                continue
+            data = await get_snapshot(topic_sources(topics))
+            if "error" in data:
+                poll_interval.failed()
+                continue
+            if await publish(data, topics): poll_interval.changed()
+            else: poll_interval.idle()
         except Exception as e:
+            poll_interval.failed()
             logger.error(f"Broadcast loop error: {e}")
 
+async def hash_handshakes():
+    """Background hasher feeding the content index behind duplicates, dedupe and the sync manifest,
+    then parsing newly hashed captures for the BSSID/ESSID/EAPOL details shown in the listing and
+    flagging captures found in the crack_house potfiles as cracked."""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, handshake_index.load_cache)
+    except Exception as e:
+        logger.error(f"Could not load capture cache: {e}")
+    while True:
+        try:
+            await get_handshakes()
+            hashed = await loop.run_in_executor(None, handshake_index.hash_pending, HASH_BATCH_SIZE)
+            annotated = await loop.run_in_executor(None, handshake_index.annotate_pending, HASH_BATCH_SIZE)
+            if AUTO_DEDUPE and not handshake_index.duplicates()["pending"]:
+                await loop.run_in_executor(None, handshake_index.dedupe)
+            potfiles_changed = await loop.run_in_executor(None, potfiles.refresh)
+            flagged = await loop.run_in_executor(None, handshake_index.annotate_cracked, potfiles.cracked, potfiles_changed)
+            if annotated or flagged: source_caches["handshakes"].invalidate()
+            backlog = hashed == HASH_BATCH_SIZE or annotated == HASH_BATCH_SIZE
+            await loop.run_in_executor(None, handshake_index.save_cache, CAPTURE_CACHE_SAVE_INTERVAL if backlog else 0)
+            if backlog:
+                await asyncio.sleep(1)  # more backlog: keep going, but leave the CPU some air
+                continue
+        except Exception as e:
+            logger.error(f"Handshake hashing error: {e}")
+        await asyncio.sleep(HASH_INTERVAL)
+
+async def record_telemetry():
+    """Samples device stats into the telemetry store and the per-epoch archive, whether or not any
+    dashboard is connected.
+
+    Reads through the shared data cache, so while the broadcast loop is running both share one fetch.
+    Samples every TELEMETRY_IDLE_INTERVAL while nobody is watching, or not at all if that is None,
+    and backs off towards TELEMETRY_RETRY_MAX while the Pwnagotchi API is unreachable.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            data = await source_caches["data"].get()
+            if "error" in data:
+                telemetry_interval.failed()
+            else:
+                telemetry_interval.reset()
+                now = time.time()
+                if telemetry.record(now, sample_from_snapshot(data)):
+                    await loop.run_in_executor(None, telemetry.flush)
+                if archive.append(now, data):
+                    await loop.run_in_executor(None, archive.flush)
+        except Exception as e:
+            telemetry_interval.failed()
+            logger.error(f"Telemetry recording error: {e}")
+        if manager.active_connections:
+            await asyncio.sleep(telemetry_interval.current)
+        elif TELEMETRY_IDLE_INTERVAL is None:
+            await manager.wait_for_clients()
+        else:
+            await asyncio.sleep(max(telemetry_interval.current, TELEMETRY_IDLE_INTERVAL))
+
+async def subscribe(websocket: WebSocket, topics: List[str]):
+    """Subscribes a client to topics and sends a snapshot for each newly added one."""
+    added = manager.subscribe(websocket, topics)
+    stale = [topic for topic in added if feeds[topic].current is None]
+    for topic in added:
+        if topic not in stale: manager.send(websocket, snapshot_message(topic))
+    if stale:
+        # No current snapshot for these topics: fetch one; publishing it reaches this client too.
+        data = await get_snapshot(topic_sources(stale))
+        if "error" not in data:
+            await publish(data, stale)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """Live feed. Clients subscribe to topics with ?topics=status,peers (default: all) or
+    {"type": "subscribe"|"unsubscribe", "topics": [...]}, and ask for {"type": "resync", "topic": ...}.
+    Feed frames are JSON text unless the client negotiated a binary subprotocol (e.g. "msgpack");
+    control messages may be JSON text frames, or binary frames in the negotiated encoding.
+    Malformed control messages are ignored."""
     await manager.connect(websocket)
     try:
-        data = await get_pwnagotchi_data()
-        if "error" not in data:
-            peers = await get_peers()
-            if "error" not in peers:
-                data["peers"] = peers
-            handshakes = await get_handshakes()
-            if "error" not in handshakes:
-                data["handshakes"] = handshakes
-            await websocket.send_text(json.dumps(data))
+        await subscribe(websocket, parse_topics(websocket.query_params.get("topics", ",".join(TOPICS)).split(",")))
         while True:
-            await asyncio.sleep(1)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            frame = message.get("text") if message.get("text") is not None else message.get("bytes")
+            client = manager.active_connections.get(websocket)
+            if frame is None or client is None:
+                continue
+            try:
+                request = decode_frame(frame, client.encoding)
+            except ValueError:
+                continue
+            if not isinstance(request, dict):
+                continue
+            kind = request.get("type")
+            topics = request.get("topics") if isinstance(request.get("topics"), list) else []
+            if kind == "subscribe":
+                await subscribe(websocket, parse_topics(topics))
+            elif kind == "unsubscribe":
+                manager.unsubscribe(websocket, parse_topics(topics))
+            elif kind == "resync":
+                topics = parse_topics([request["topic"]]) if "topic" in request else TOPICS
+                for topic in manager.subscribed(websocket):
+                    message = snapshot_message(topic)
+                    if topic in topics and message is not None: manager.send(websocket, message)
     except WebSocketDisconnect:
         pass
     finally:
@@ -180,6 +567,36 @@ async def read_root():
 
 @app.on_event("startup")
 async def on_startup():
-    asyncio.create_task(broadcast_updates())
+    await open_client()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, telemetry.load)
+    except Exception as e:
+        logger.error(f"Could not load telemetry history: {e}")
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, archive.open)
+    except Exception as e:
+        logger.error(f"Could not open snapshot archive; snapshots will not be archived: {e}")
+    background_tasks.append(asyncio.create_task(broadcast_updates()))
+    background_tasks.append(asyncio.create_task(hash_handshakes()))
+    background_tasks.append(asyncio.create_task(record_telemetry()))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in background_tasks: task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, telemetry.flush)
+    except Exception as e:
+        logger.error(f"Could not save telemetry history: {e}")
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, archive.flush)
+    except Exception as e:
+        logger.error(f"Could not save snapshot archive: {e}")
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, handshake_index.save_cache)
+    except Exception as e:
+        logger.error(f"Could not save capture cache: {e}")
+    await close_client()
 
-if __name__ == "__main__": uvicorn.run(app, host=HOST, port=PORT)
\ No newline at end of file
+if __name__ == "__main__": uvicorn.run(app, host=HOST, port=PORT, ws=TunedWebSocketProtocol)
\ No newline at end of file
@@ -0,0 +1,221 @@
+import struct
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+# --- Configuration ---
+MAX_RECORD_SIZE = 256 * 1024  # larger records mean a corrupt file; stop reading it
+
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+LINKTYPE_PRISM = 119
+LINKTYPE_AVS = 163
+
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": "<", b"\xa1\xb2\xc3\xd4": ">",  # microsecond timestamps
+    b"\x4d\x3c\xb2\xa1": "<", b"\xa1\xb2\x3c\x4d": ">",  # nanosecond timestamps
+}
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_ENHANCED_PACKET = 6
+
+EAPOL_SNAP = b"\xaa\xaa\x03\x00\x00\x00\x88\x8e"
+PMKID_KDE = b"\xdd\x14\x00\x0f\xac\x04"
+KEY_INFO_ACK, KEY_INFO_MIC, KEY_INFO_SECURE = 0x0080, 0x0100, 0x0200
+
+# radiotap fields before the channel field: (alignment, size) for TSFT, Flags, Rate
+RADIOTAP_LEADING_FIELDS = ((8, 8), (1, 1), (1, 1))
+RADIOTAP_FLAG_FCS = 0x10
+
+def _records(f: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """Yields (linktype, frame) for each packet of a pcap or pcapng stream."""
+    magic = f.read(4)
+    if magic in PCAP_MAGICS:
+        endian = PCAP_MAGICS[magic]
+        header = f.read(20)
+        if len(header) < 20:
+            return
+        linktype = struct.unpack(endian + "HHiIII", header)[5] & 0xFFFF
+        while True:
+            record = f.read(16)
+            if len(record) < 16:
+                return
+            caplen = struct.unpack(endian + "IIII", record)[2]
+            if caplen > MAX_RECORD_SIZE:
+                return
+            frame = f.read(caplen)
+            if len(frame) < caplen:
+                return
+            yield linktype, frame
+    elif len(magic) == 4 and struct.unpack("<I", magic)[0] == PCAPNG_SECTION_HEADER:
+        yield from _pcapng_records(f, magic)
+
+def _pcapng_records(f: BinaryIO, first: bytes) -> Iterator[Tuple[int, bytes]]:
+    block_type_raw = first
+    linktypes = []
+    endian = "<"
+    while True:
+        length_raw = f.read(4)
+        if len(length_raw) < 4:
+            return
+        block_type = struct.unpack(endian + "I", block_type_raw)[0]
+        if block_type == PCAPNG_SECTION_HEADER:
+            body_start = f.read(4)  # byte-order magic decides the endianness of this section
+            endian = "<" if body_start == b"\x4d\x3c\x2b\x1a" else ">"
+            block_length = struct.unpack(endian + "I", length_raw)[0]
+            if block_length < 16 or block_length > MAX_RECORD_SIZE:
+                return
+            body = body_start + f.read(block_length - 16)
+            linktypes = []
+        else:
+            block_length = struct.unpack(endian + "I", length_raw)[0]
+            if block_length < 12 or block_length > MAX_RECORD_SIZE:
+                return
+            body = f.read(block_length - 12)
+        if len(f.read(4)) < 4:
+            return
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION and len(body) >= 2:
+            linktypes.append(struct.unpack(endian + "H", body[:2])[0])
+        elif block_type == PCAPNG_ENHANCED_PACKET and len(body) >= 20:
+            interface, _, _, caplen, _ = struct.unpack(endian + "IIIII", body[:20])
+            if interface < len(linktypes):
+                yield linktypes[interface], body[20:20 + caplen]
+        block_type_raw = f.read(4)
+        if len(block_type_raw) < 4:
+            return
+
+def _radiotap(frame: bytes) -> Tuple[Optional[bytes], Optional[int]]:
+    """Strips a radiotap header; returns (802.11 frame, channel frequency in MHz or None)."""
+    if len(frame) < 8:
+        return None, None
+    length, present = struct.unpack_from("<HI", frame, 2)
+    if length > len(frame):
+        return None, None
+    offset = 8
+    words = present
+    while words & 0x80000000 and offset + 4 <= length:  # extended presence bitmaps
+        words = struct.unpack_from("<I", frame, offset)[0]
+        offset += 4
+    frequency, fcs = None, False
+    for bit, (align, size) in enumerate(RADIOTAP_LEADING_FIELDS):
+        if present & (1 << bit):
+            offset += -offset % align
+            if bit == 1 and offset < length:
+                fcs = bool(frame[offset] & RADIOTAP_FLAG_FCS)
+            offset += size
+    if present & (1 << 3):
+        offset += -offset % 2
+        if offset + 2 <= length:
+            frequency = struct.unpack_from("<H", frame, offset)[0]
+    body = frame[length:-4] if fcs else frame[length:]
+    return body, frequency
+
+def _strip_link_header(linktype: int, frame: bytes) -> Tuple[Optional[bytes], Optional[int]]:
+    if linktype == LINKTYPE_IEEE802_11_RADIOTAP:
+        return _radiotap(frame)
+    if linktype == LINKTYPE_IEEE802_11:
+        return frame, None
+    if linktype == LINKTYPE_PRISM and len(frame) >= 8:
+        return frame[struct.unpack_from("<I", frame, 4)[0]:], None
+    if linktype == LINKTYPE_AVS and len(frame) >= 8:
+        return frame[struct.unpack_from(">I", frame, 4)[0]:], None
+    return None, None
+
+def _mac(raw: bytes) -> str:
+    return ":".join(f"{b:02x}" for b in raw)
+
+def _frequency_to_channel(frequency: int) -> Optional[int]:
+    if frequency == 2484:
+        return 14
+    if 2412 <= frequency <= 2472:
+        return (frequency - 2407) // 5
+    if 5000 <= frequency <= 5900:
+        return (frequency - 5000) // 5
+    return None
+
+def _tags(body: bytes) -> Iterator[Tuple[int, bytes]]:
+    offset = 0
+    while offset + 2 <= len(body):
+        tag, length = body[offset], body[offset + 1]
+        yield tag, body[offset + 2:offset + 2 + length]
+        offset += 2 + length
+
+def _eapol_message(key: bytes) -> Tuple[Optional[int], bool]:
+    """Returns (handshake message number 1-4 or None, PMKID present) for an EAPOL-Key descriptor."""
+    if len(key) < 95:
+        return None, False
+    info = struct.unpack_from(">H", key, 1)[0]
+    ack, mic = bool(info & KEY_INFO_ACK), bool(info & KEY_INFO_MIC)
+    if ack and not mic:
+        message = 1
+    elif ack and mic:
+        message = 3
+    elif mic:
+        message = 4 if info & KEY_INFO_SECURE else 2
+    else:
+        return None, False
+    pmkid = False
+    if message == 1:
+        data_length = struct.unpack_from(">H", key, 93)[0]
+        data = key[95:95 + data_length]
+        index = data.find(PMKID_KDE)
+        pmkid = index >= 0 and any(data[index + 6:index + 22])
+    return message, pmkid
+
+def parse_capture(path: Path) -> Dict[str, Any]:
+    """Reads a capture once and extracts the access point it is about.
+
+    Returns bssid, essid, channel, eapol_count (EAPOL-Key frames), eapol_messages (distinct
+    4-way handshake messages seen, 1-4) and pmkid. The BSSID is the one the EAPOL frames
+    belong to, falling back to the first beaconing AP. Unknown values are None.
+    """
+    networks: Dict[str, Dict[str, Any]] = {}
+    eapol: Dict[str, Dict[str, Any]] = {}
+    first_bssid = None
+    with open(path, "rb") as f:
+        for linktype, frame in _records(f):
+            dot11, frequency = _strip_link_header(linktype, frame)
+            if dot11 is None or len(dot11) < 24:
+                continue
+            fc0, fc1 = dot11[0], dot11[1]
+            kind, subtype = (fc0 >> 2) & 3, fc0 >> 4
+            if kind == 0 and subtype in (0, 2, 5, 8):  # (re)association request, probe response, beacon
+                bssid = _mac(dot11[16:22])
+                fixed = {0: 4, 2: 10, 5: 12, 8: 12}[subtype]
+                network = networks.setdefault(bssid, {"essid": None, "channel": None})
+                for tag, value in _tags(dot11[24 + fixed:]):
+                    if tag == 0 and value and any(value) and network["essid"] is None:
+                        network["essid"] = value.decode("utf-8", "replace")
+                    elif tag == 3 and len(value) == 1:
+                        network["channel"] = value[0]
+                if network["channel"] is None and frequency:
+                    network["channel"] = _frequency_to_channel(frequency)
+                if subtype in (5, 8) and first_bssid is None:
+                    first_bssid = bssid
+            elif kind == 2 and not fc1 & 0x40:  # unprotected data
+                to_ds, from_ds = fc1 & 0x01, fc1 & 0x02
+                header = 24 + (6 if to_ds and from_ds else 0) + (2 if subtype & 0x08 else 0)
+                if dot11[header:header + 8] != EAPOL_SNAP:
+                    continue
+                packet = dot11[header + 8:]
+                if len(packet) < 4 or packet[1] != 3:  # EAPOL-Key
+                    continue
+                bssid = _mac(dot11[4:10] if to_ds and not from_ds else dot11[10:16] if from_ds and not to_ds else dot11[16:22])
+                message, pmkid = _eapol_message(packet[4:])
+                seen = eapol.setdefault(bssid, {"count": 0, "messages": set(), "pmkid": False, "frequency": frequency})
+                seen["count"] += 1
+                if message is not None: seen["messages"].add(message)
+                seen["pmkid"] = seen["pmkid"] or pmkid
+    bssid = max(eapol, key=lambda b: eapol[b]["count"]) if eapol else first_bssid
+    network = networks.get(bssid, {}) if bssid else {}
+    seen = eapol.get(bssid, {}) if bssid else {}
+    channel = network.get("channel")
+    if channel is None and seen.get("frequency"):
+        channel = _frequency_to_channel(seen["frequency"])
+    return {
+        "bssid": bssid,
+        "essid": network.get("essid"),
+        "channel": channel,
+        "eapol_count": seen.get("count", 0),
+        "eapol_messages": sorted(seen.get("messages", ())),
+        "pmkid": seen.get("pmkid", False),
+    }
@@ -0,0 +1,169 @@
+import binascii
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from handshake_index import BSSID_IN_NAME, bssid_from_name
+
+# --- Configuration ---
+CRACK_HOUSE_CONFIG = Path(__file__).parent / "backend" / "config.yaml"
+DEFAULT_POTFILES = [
+    Path("/root/handshakes/wpa-sec.cracked.potfile"),
+    Path("/root/handshakes/my.potfile"),
+    Path("/root/handshakes/OnlineHashCrack.potfile"),
+]
+
+HEAD_SIZE = 64  # leading bytes compared on each refresh to notice a potfile rewritten in place
+
+MAC_PATTERN = r"(?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}|(?:[0-9a-fA-F]{2}-){5}[0-9a-fA-F]{2}|[0-9a-fA-F]{12}"
+MAC = re.compile(rf"^(?:{MAC_PATTERN})$")
+# [hash:]bssid:station:rest, matched before splitting so colon-separated MACs stay whole
+CRACKED_NETWORK = re.compile(rf"^(?:[0-9a-fA-F]{{16,}}:)?({MAC_PATTERN}):(?:{MAC_PATTERN}):(.*)$")
+MAX_ESSID_BYTES = 32
+HEX_VALUE = re.compile(r"^\$HEX\[([0-9a-fA-F]*)\]$")
+
+logger = logging.getLogger(__name__)
+
+def potfile_paths(config_path: Path = CRACK_HOUSE_CONFIG) -> List[Path]:
+    """Returns the potfiles listed under plugins.crack_house.files, or DEFAULT_POTFILES."""
+    try:
+        with open(config_path) as f:
+            files = (((yaml.safe_load(f) or {}).get("plugins") or {}).get("crack_house") or {}).get("files")
+    except (OSError, yaml.YAMLError) as e:
+        logger.warning(f"Could not read crack_house potfiles from {config_path}: {e}")
+        files = None
+    return [Path(p) for p in files] if files else list(DEFAULT_POTFILES)
+
+def _normalize_bssid(value: str) -> Optional[str]:
+    if not MAC.match(value):
+        return None
+    raw = value.replace(":", "").replace("-", "").lower()
+    return ":".join(raw[i:i + 2] for i in range(0, 12, 2))
+
+def _decode_hex(value: str) -> str:
+    try:
+        return binascii.unhexlify(value).decode("utf-8", "replace")
+    except (binascii.Error, ValueError):
+        return value
+
+def _unwrap(value: str) -> str:
+    """Decodes hashcat's $HEX[...] notation for values with separators or non-ASCII bytes."""
+    match = HEX_VALUE.match(value)
+    return _decode_hex(match.group(1)) if match else value
+
+def parse_potfile_line(line: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """Returns (bssid, essid) of a cracked network from one potfile line, or None if unrecognised.
+
+    Understands wpa-sec's "bssid:station:essid:password", hashcat's "hash:bssid:station:essid:password"
+    (modes 2500/22000), the "*"-separated PMKID/22000 hash lines, and plain "essid:password" with
+    exactly one colon and an ESSID of 1-32 bytes. BSSIDs may be bare hex or colon/dash separated.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    head, _, _ = line.partition(":")
+    if "*" in head:
+        parts = head.split("*")
+        if parts[0] == "WPA" and len(parts) >= 6:  # WPA*type*pmkid_or_mic*bssid*station*essid_hex*...
+            return _normalize_bssid(parts[3]), _decode_hex(parts[5])
+        if len(parts) >= 4:  # pmkid*bssid*station*essid_hex
+            return _normalize_bssid(parts[1]), _decode_hex(parts[3])
+        return None
+    match = CRACKED_NETWORK.match(line)
+    if match:
+        essid, separator, _ = match.group(2).partition(":")
+        return (_normalize_bssid(match.group(1)), _unwrap(essid)) if separator else None
+    fields = line.split(":")
+    if len(fields) == 2:
+        essid = _unwrap(fields[0])
+        return (None, essid) if 1 <= len(essid.encode("utf-8")) <= MAX_ESSID_BYTES else None
+    return None
+
+class _Tail:
+    """Read position in one potfile, and the networks it contributed."""
+    def __init__(self):
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.head = b""
+        self.bssids: Dict[str, Optional[str]] = {}
+        self.essids: Dict[str, int] = {}  # essids of lines without a bssid
+
+class PotfileIndex:
+    """Cracked networks from a set of potfiles, keyed by BSSID and by ESSID.
+
+    refresh() reads only the bytes appended since the previous call, up to the last complete
+    line. A potfile that was replaced or truncated is read again from the start, replacing what
+    it contributed before. refresh() blocks on file I/O and is meant to run in a worker thread.
+    """
+    def __init__(self, paths: List[Path]):
+        self.paths = list(paths)
+        self._tails: Dict[Path, _Tail] = {path: _Tail() for path in self.paths}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """Ingests new potfile lines. Returns True if any potfile changed."""
+        with self._lock:
+            changed = False
+            for path, tail in self._tails.items():
+                try:
+                    changed = self._read(path) or changed
+                except FileNotFoundError:
+                    if tail.inode is not None:
+                        self._tails[path] = _Tail()
+                        changed = True
+            return changed
+
+    def _read(self, path: Path) -> bool:
+        tail = self._tails[path]
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            reset = st.st_ino != tail.inode or st.st_size < tail.offset or f.read(len(tail.head)) != tail.head
+            if reset:
+                if tail.inode is not None: logger.info(f"Potfile {path} was replaced; reading it again.")
+                tail = self._tails[path] = _Tail()
+                tail.inode = st.st_ino
+            if st.st_size == tail.offset:
+                return reset
+            f.seek(tail.offset)
+            data = f.read(st.st_size - tail.offset)
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return reset
+        if len(tail.head) < HEAD_SIZE and tail.offset < HEAD_SIZE:
+            tail.head = (tail.head + data[:end])[:HEAD_SIZE]
+        tail.offset += end
+        for line in data[:end].decode("utf-8", "replace").splitlines():
+            parsed = parse_potfile_line(line)
+            if parsed is None:
+                continue
+            bssid, essid = parsed
+            if bssid is not None:
+                tail.bssids[bssid] = essid
+            elif essid:
+                tail.essids[essid] = tail.essids.get(essid, 0) + 1
+        return True
+
+    def is_cracked(self, bssid: Optional[str], essid: Optional[str]) -> bool:
+        """A capture is cracked if a potfile has its BSSID, or its ESSID on a line that names no BSSID."""
+        tails = list(self._tails.values())
+        if bssid is not None and any(bssid in tail.bssids for tail in tails):
+            return True
+        return bool(essid) and any(essid in tail.essids for tail in tails)
+
+    def cracked(self, entry: Dict[str, Any]) -> bool:
+        """is_cracked() for a handshake listing entry, falling back to the <essid>_<bssid>.pcap filename."""
+        name = entry["name"]
+        bssid = entry.get("bssid") or bssid_from_name(name)
+        essid = entry.get("essid")
+        if essid is None and BSSID_IN_NAME.search(name):
+            essid = BSSID_IN_NAME.split(name)[0]
+        return self.is_cracked(bssid, essid)
+
+    def stats(self) -> Dict[str, Any]:
+        return {str(path): {"offset": tail.offset, "bssids": len(tail.bssids), "essids": len(tail.essids)}
+                for path, tail in self._tails.items()}
@@ -1,42 +1,78 @@
 import asyncio
 import json
 import logging
+import os
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterable, Set
 
 import httpx
 
+from handshake_index import HandshakeIndex
+from serializers import loads
+
 # --- Configuration ---
 PWNAGOTCHI_API_URL = "http://127.0.0.1:8666/api/v1"
+HANDSHAKE_DIR = Path("/root/handshakes/")
+DATA_DIR = Path(os.environ.get("PWNSTRO_DATA_DIR", Path.home() / ".pwnstro"))  # must be writable by the service user
+CAPTURE_CACHE_PATH = DATA_DIR / "captures.json"  # content hashes and parsed metadata kept across restarts
+HTTP_TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+HTTP_LIMITS = httpx.Limits(max_connections=4, max_keepalive_connections=2, keepalive_expiry=30.0)
+SOURCE_TIMEOUTS = {"data": 3.0, "peers": 1.5, "handshakes": 2.0}  # seconds per snapshot source
+SNAPSHOT_TTL = 0.9  # seconds; kept below the fastest broadcast interval so every tick sees fresh data
 
 logger = logging.getLogger(__name__)
 
+_client: Optional[httpx.AsyncClient] = None
+_failing: Set[str] = set()  # sources whose last fetch failed; repeats are logged at debug level
+handshake_index = HandshakeIndex(HANDSHAKE_DIR, cache_path=CAPTURE_CACHE_PATH)
+
+async def open_client(timeout: httpx.Timeout = HTTP_TIMEOUT, limits: httpx.Limits = HTTP_LIMITS) -> httpx.AsyncClient:
+    """Creates the shared keep-alive client used for every Pwnagotchi API call."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(base_url=PWNAGOTCHI_API_URL, timeout=timeout, limits=limits)
+    return _client
+
+async def close_client():
+    """Closes the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _report_failure(source: str, message: str):
+    """Logs the first failure of a source as an error and repeats only at debug level until it recovers."""
+    if source in _failing:
+        logger.debug(message)
+    else:
+        _failing.add(source)
+        logger.error(f"{message} (repeats are logged at debug level until it recovers)")
+
+def _report_success(source: str):
+    if source in _failing:
+        _failing.discard(source)
+        logger.info(f"Fetching {source} from the Pwnagotchi API works again.")
+
 async def get_pwnagotchi_data() -> Dict[str, Any]:
     """Fetches data from the Pwnagotchi's local API."""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{PWNAGOTCHI_API_URL}/data")
-            response.raise_for_status()
-            return response.json()
+        client = await open_client()
+        response = await client.get("/data")
+        response.raise_for_status()
+        return loads(response.content)
     except httpx.RequestError as e:
-        logger.error(f"Error fetching data from Pwnagotchi API: {e}")
+        _report_failure("data", f"Error fetching data from Pwnagotchi API: {e}")
         return {"error": "Could not connect to Pwnagotchi API"}
     except json.JSONDecodeError as e:
-        logger.error(f"Error decoding JSON from Pwnagotchi API: {e}")
+        _report_failure("data", f"Error decoding JSON from Pwnagotchi API: {e}")
         return {"error": "Invalid JSON response from Pwnagotchi API"}
 
 async def get_handshakes() -> Dict[str, Any]:
-    """Fetches the list of handshakes from the Pwnagotchi's handshake directory."""
+    """Returns the list of handshakes from the incrementally maintained handshake index."""
     try:
-        handshake_dir = Path("/root/handshakes/")
-        handshakes = []
-        for handshake_file in handshake_dir.glob("*.pcap"):
-            handshakes.append({
-                "name": handshake_file.name,
-                "timestamp": handshake_file.stat().st_mtime,
-                "size_kb": round(handshake_file.stat().st_size / 1024, 2)
-            })
-        return handshakes
+        # The directory walk blocks on SD card I/O, so keep it off the event loop.
+        await asyncio.get_running_loop().run_in_executor(None, handshake_index.refresh)
+        return handshake_index.listing()
     except Exception as e:
         logger.error(f"Error fetching handshakes: {e}")
         return {"error": "Could not fetch handshakes"}
@@ -44,13 +80,80 @@ async def get_handshakes() -> Dict[str, Any]:
 async def get_peers() -> Dict[str, Any]:
     """Fetches the list of peers from the Pwnagotchi's local API."""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{PWNAGOTCHI_API_URL}/mesh/peers")
-            response.raise_for_status()
-            return response.json()
+        client = await open_client()
+        response = await client.get("/mesh/peers")
+        response.raise_for_status()
+        return loads(response.content)
     except httpx.RequestError as e:
-        logger.error(f"Error fetching peers from Pwnagotchi API: {e}")
+        _report_failure("peers", f"Error fetching peers from Pwnagotchi API: {e}")
         return {"error": "Could not connect to Pwnagotchi API"}
     except json.JSONDecodeError as e:
-        logger.error(f"Error decoding JSON from Pwnagotchi API: {e}")
+        _report_failure("peers", f"Error decoding JSON from Pwnagotchi API: {e}")
         return {"error": "Invalid JSON response from Pwnagotchi API"}
+
+async def _fetch_source(name: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Runs one snapshot source under its own timeout so a slow source only drops its own part."""
+    try:
+        result = await asyncio.wait_for(fetch(), SOURCE_TIMEOUTS[name])
+    except asyncio.TimeoutError:
+        _report_failure(name, f"Timed out fetching {name} after {SOURCE_TIMEOUTS[name]}s")
+        return {"error": f"Timed out fetching {name}"}
+    if not (isinstance(result, dict) and "error" in result): _report_success(name)
+    return result
+
+class SnapshotCache:
+    """Caches a value for a short TTL and coalesces concurrent refreshes into one fetch.
+
+    Callers share the returned value and must treat it as read-only.
+    """
+    def __init__(self, builder: Callable[[], Awaitable[Any]], ttl: float = SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._builder = builder
+        self._value: Any = None
+        self._fetched_at = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+
+    async def get(self) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._value is not None and loop.time() - self._fetched_at < self.ttl:
+            return self._value
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        # Shielded so a caller disconnecting mid-fetch does not cancel it for everyone else.
+        return await asyncio.shield(self._inflight)
+
+    def invalidate(self):
+        self._value = None
+
+    async def _refresh(self) -> Any:
+        try:
+            value = await self._builder()
+            self._value, self._fetched_at = value, asyncio.get_running_loop().time()
+            return value
+        finally:
+            self._inflight = None
+
+SNAPSHOT_SOURCES = ("data", "peers", "handshakes")
+source_caches = {
+    "data": SnapshotCache(lambda: _fetch_source("data", get_pwnagotchi_data)),
+    "peers": SnapshotCache(lambda: _fetch_source("peers", get_peers)),
+    "handshakes": SnapshotCache(lambda: _fetch_source("handshakes", get_handshakes)),
+}
+
+async def get_snapshot(sources: Iterable[str] = SNAPSHOT_SOURCES) -> Dict[str, Any]:
+    """Composes device data, peers and handshakes into one dashboard snapshot.
+
+    Only the requested sources are fetched. They run concurrently, each through its own
+    single-flight cache, so concurrent callers share one upstream request per TTL. Peers or
+    handshakes that fail or time out are left out of the snapshot rather than failing it.
+    """
+    sources = tuple(sources)
+    results = dict(zip(sources, await asyncio.gather(*(source_caches[name].get() for name in sources))))
+    data = results.get("data", {})
+    if "error" in data:
+        return data
+    snapshot = dict(data)  # the cached dict is shared, so compose into a copy
+    for name in ("peers", "handshakes"):
+        if name in results and "error" not in results[name]:
+            snapshot[name] = results[name]
+    return snapshot
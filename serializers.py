@@ -0,0 +1,77 @@
+import json
+import logging
+from typing import Any, Dict, Callable, List, Optional, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+Frame = Union[str, bytes]
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    loads = orjson.loads
+else:
+    logger.info("orjson not installed; using the standard library json module.")
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    loads = json.loads
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fastest JSON backend available."""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def encode_json(message: Any) -> str:
+    return dumps(message).decode("utf-8")
+
+def encode_msgpack(message: Any) -> bytes:
+    return msgpack.packb(message, use_bin_type=True)
+
+def decode_msgpack(frame: bytes) -> Any:
+    try:
+        return msgpack.unpackb(frame, raw=False)
+    except Exception as e:  # msgpack raises several unrelated types for malformed input
+        raise ValueError(f"Invalid msgpack frame: {e}") from e
+
+# WebSocket subprotocols a client may negotiate for a binary feed; JSON text frames stay the default.
+WS_SUBPROTOCOLS: Dict[str, Callable[[Any], Frame]] = {}
+WS_DECODERS: Dict[str, Callable[[bytes], Any]] = {"json": loads}
+if msgpack is not None:
+    WS_SUBPROTOCOLS["msgpack"] = encode_msgpack
+    WS_DECODERS["msgpack"] = decode_msgpack
+else:
+    logger.info("msgpack not installed; the binary /ws subprotocol is disabled.")
+
+WS_ENCODERS: Dict[str, Callable[[Any], Frame]] = {"json": encode_json, **WS_SUBPROTOCOLS}
+
+def negotiate_subprotocol(offered: List[str]) -> Optional[str]:
+    """Picks the first subprotocol the client offered that this server supports, if any."""
+    for subprotocol in offered:
+        if subprotocol in WS_SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+def encode_frame(message: Any, encoding: str) -> Frame:
+    """Encodes a feed message as a text (JSON) or binary frame."""
+    return WS_ENCODERS[encoding](message)
+
+def decode_frame(frame: Frame, encoding: str) -> Any:
+    """Decodes a client frame: text frames are JSON, binary frames use the negotiated encoding.
+
+    Raises ValueError for a malformed frame.
+    """
+    if isinstance(frame, str):
+        return loads(frame)
+    return WS_DECODERS[encoding](frame)
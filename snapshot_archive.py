@@ -0,0 +1,220 @@
+import bisect
+import logging
+import math
+import mmap
+import os
+import threading
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from telemetry import DATA_DIR, json_floats, parse_stat
+
+# --- Configuration ---
+ARCHIVE_DIR = DATA_DIR / "archive"
+ARCHIVE_FLUSH_ROWS = 20  # rows buffered in RAM before one append per column file
+ARCHIVE_MAX_GAP = 60.0  # seconds; a row is archived at least this often even if the epoch did not change
+INDEX_STRIDE = 512  # rows per sparse index entry: one 4 KiB page of timestamps
+
+# Column name -> (section, key); every column is float32 except the timestamp column.
+ARCHIVE_COLUMNS = {
+    "epoch": ("device_info", "epoch"),
+    "cpu_load": ("device_info", "cpu_load"),
+    "memory": ("device_info", "memory"),
+    "temperature": ("device_info", "temperature"),
+    "aps": ("session_stats", "aps_total"),
+    "handshakes": ("session_stats", "handshakes_total"),
+    "ai_enabled": ("ai_stats", "ai_enabled"),
+    "learning_rate": ("ai_stats", "learning_rate"),
+    "epsilon": ("ai_stats", "epsilon"),
+    "excited_epochs": ("ai_stats", "excited_epochs"),
+    "bored_epochs": ("ai_stats", "bored_epochs"),
+    "sad_epochs": ("ai_stats", "sad_epochs"),
+}
+
+logger = logging.getLogger(__name__)
+
+def _column_value(data: Dict[str, Any], section: str, key: str) -> float:
+    value = (data.get(section) or {}).get(key)
+    return float(value) if isinstance(value, bool) else parse_stat(value)
+
+class SnapshotArchive:
+    """Append-only columnar archive of device snapshots, one row per epoch.
+
+    Each column is its own file of fixed-width native floats, so a row is found by offset alone.
+    A sparse index holds the timestamp of every INDEX_STRIDE-th row; a range query bisects it in
+    RAM, then reads one page of timestamps and just the requested slice of each column through a
+    short-lived read-only mmap. Nothing grows in RAM with the archive except that index
+    (8 bytes per 512 rows).
+
+    Rows are buffered and appended ARCHIVE_FLUSH_ROWS at a time. Nothing is buffered or written
+    until open() has succeeded, so a failed open cannot append past rows it did not count.
+    open(), flush() and query() block on file I/O and are meant to run in a worker thread.
+    """
+    def __init__(self, directory: Path = ARCHIVE_DIR, columns: Dict[str, Any] = ARCHIVE_COLUMNS):
+        self.directory = directory
+        self.columns = dict(columns)
+        self.rows = 0
+        self._index = array("d")
+        self._pending: Dict[str, array] = self._empty_batch()
+        self._last_timestamp: Optional[float] = None
+        self._last_epoch: Optional[float] = None
+        self._opened = False
+        self._lock = threading.Lock()
+
+    def _empty_batch(self) -> Dict[str, array]:
+        return {"timestamp": array("d"), **{name: array("f") for name in self.columns}}
+
+    def _path(self, column: str) -> Path:
+        return self.directory / f"{column}.col"
+
+    def open(self):
+        """Recovers the row count and rebuilds the sparse index if it does not match the columns.
+
+        Column files cut short by a crash mid-append are truncated to the last complete row.
+        """
+        with self._lock:
+            self._opened = False
+            self.directory.mkdir(parents=True, exist_ok=True)
+            sizes = {"timestamp": 8, **{name: 4 for name in self.columns}}
+            counts = {}
+            for column, size in sizes.items():
+                try:
+                    counts[column] = self._path(column).stat().st_size // size
+                except FileNotFoundError:
+                    counts[column] = 0
+            self.rows = min(counts.values())
+            for column, size in sizes.items():
+                path = self._path(column)
+                if path.exists() and path.stat().st_size != self.rows * size:
+                    logger.warning(f"Truncating archive column {column} to {self.rows} rows.")
+                    os.truncate(path, self.rows * size)
+                elif not path.exists():
+                    path.touch()
+            self._index = array("d")
+            index_path = self.directory / "timestamp.idx"
+            expected = math.ceil(self.rows / INDEX_STRIDE)
+            if index_path.exists() and index_path.stat().st_size == expected * 8:
+                self._index.frombytes(index_path.read_bytes())
+            elif self.rows:
+                with open(self._path("timestamp"), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for row in range(0, self.rows, INDEX_STRIDE):
+                        self._index.frombytes(mm[row * 8:row * 8 + 8])
+                index_path.write_bytes(self._index.tobytes())
+            if self.rows:
+                last = array("d")
+                with open(self._path("timestamp"), "rb") as f:
+                    f.seek((self.rows - 1) * 8)
+                    last.frombytes(f.read(8))
+                self._last_timestamp = last[0]
+            self._opened = True
+        logger.info(f"Opened snapshot archive with {self.rows} rows.")
+
+    def append(self, timestamp: float, data: Dict[str, Any]) -> bool:
+        """Buffers a snapshot if its epoch is new or ARCHIVE_MAX_GAP passed since the last row.
+
+        Returns True when enough rows are pending that flush() should run. Does nothing until
+        open() has succeeded.
+        """
+        epoch = _column_value(data, *self.columns["epoch"]) if "epoch" in self.columns else math.nan
+        with self._lock:
+            if not self._opened:
+                return False
+            if self._last_timestamp is not None:
+                if timestamp <= self._last_timestamp:
+                    return False
+                if epoch == self._last_epoch and timestamp - self._last_timestamp < ARCHIVE_MAX_GAP:
+                    return False
+            self._pending["timestamp"].append(timestamp)
+            for name, (section, key) in self.columns.items():
+                self._pending[name].append(_column_value(data, section, key))
+            self._last_timestamp, self._last_epoch = timestamp, epoch
+            return len(self._pending["timestamp"]) >= ARCHIVE_FLUSH_ROWS
+
+    def flush(self):
+        """Appends the pending rows to every column file, then extends the sparse index.
+
+        If a write fails, every file is cut back to the rows it held before, so the columns stay
+        aligned; the batch is dropped and the error re-raised. Should that cut fail too, writes are
+        refused until open() reconciles the files again.
+        """
+        with self._lock:
+            if not self._opened:
+                return
+            batch, self._pending = self._pending, self._empty_batch()
+            count = len(batch["timestamp"])
+            if not count:
+                return
+            first = self.rows
+            added = array("d", (batch["timestamp"][row - first] for row in range(first, first + count) if row % INDEX_STRIDE == 0))
+            try:
+                for column, values in batch.items():
+                    with open(self._path(column), "ab") as f:
+                        f.write(values.tobytes())
+                if added:
+                    with open(self.directory / "timestamp.idx", "ab") as f:
+                        f.write(added.tobytes())
+            except OSError as e:
+                logger.error(f"Could not append {count} archive rows; dropping them: {e}")
+                self._rollback()
+                raise
+            self.rows += count
+            self._index.extend(added)
+
+    def _rollback(self):
+        """Truncates every file back to the rows and index entries counted before a failed flush."""
+        sizes = {self._path("timestamp"): self.rows * 8, self.directory / "timestamp.idx": len(self._index) * 8,
+                 **{self._path(name): self.rows * 4 for name in self.columns}}
+        try:
+            for path, size in sizes.items():
+                if path.exists() and path.stat().st_size > size: os.truncate(path, size)
+        except OSError as e:
+            logger.error(f"Could not roll back the snapshot archive; it stays closed until reopened: {e}")
+            self._opened = False
+
+    def _find(self, mm: mmap.mmap, timestamp: float, right: bool) -> int:
+        """Row position of `timestamp` (bisect_left, or bisect_right if `right`) touching one index page."""
+        search = bisect.bisect_right if right else bisect.bisect_left
+        block = max(0, search(self._index, timestamp) - 1)
+        start, end = block * INDEX_STRIDE, min(self.rows, (block + 1) * INDEX_STRIDE)
+        page = array("d")
+        page.frombytes(mm[start * 8:end * 8])
+        return start + search(page, timestamp)
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              columns: Optional[Sequence[str]] = None, limit: int = 1000) -> Dict[str, Any]:
+        """Returns up to `limit` archived rows within [since, until], oldest first, as columns.
+
+        `next_since` is set when more rows remain; pass it as `since` to continue. Raises
+        ValueError for an unknown column.
+        """
+        columns = list(columns or self.columns)
+        unknown = [column for column in columns if column not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown column(s): {', '.join(unknown)}; expected any of {', '.join(self.columns)}")
+        with self._lock:
+            rows = self.rows
+            if not rows:
+                return {"timestamps": [], "series": {column: [] for column in columns}, "next_since": None}
+            with open(self._path("timestamp"), "rb") as f, mmap.mmap(f.fileno(), rows * 8, access=mmap.ACCESS_READ) as mm:
+                start = 0 if since is None else self._find(mm, since, right=False)
+                end = rows if until is None else self._find(mm, until, right=True)
+                end = max(start, min(end, start + limit + 1))
+                timestamps = array("d")
+                timestamps.frombytes(mm[start * 8:end * 8])
+            next_since = timestamps[limit] if len(timestamps) > limit else None
+            timestamps = timestamps[:limit]
+            series: Dict[str, List[Optional[float]]] = {}
+            for column in columns:
+                values = array("f")
+                with open(self._path(column), "rb") as f, mmap.mmap(f.fileno(), rows * 4, access=mmap.ACCESS_READ) as mm:
+                    values.frombytes(mm[start * 4:(start + len(timestamps)) * 4])
+                series[column] = json_floats(values)
+        return {
+            "timestamps": timestamps.tolist(),
+            "series": series,
+            "next_since": next_since,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"opened": self._opened, "rows": self.rows, "pending": len(self._pending["timestamp"]), "index_entries": len(self._index)}
@@ -0,0 +1,347 @@
+import bisect
+import logging
+import math
+import os
+import struct
+import threading
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# --- Configuration ---
+DATA_DIR = Path(os.environ.get("PWNSTRO_DATA_DIR", Path.home() / ".pwnstro"))  # must be writable by the service user
+TELEMETRY_DIR = DATA_DIR / "telemetry"
+TELEMETRY_FIELDS = ("cpu_load", "memory", "temperature", "epoch", "aps", "handshakes")
+RAW_CAPACITY = 1800  # samples; an hour at the 2 s sampling interval
+ROLLUPS = {"minute": (60, 1440), "hour": (3600, 24 * 90)}  # resolution: (bucket seconds, rows kept)
+FLUSH_ROWS = 30  # rollup rows buffered in RAM before one append to the SD card
+MAX_BUCKETS = 2000  # per aggregated history query
+FILE_MAGIC = b"PWTS"
+NAN = float("nan")
+
+logger = logging.getLogger(__name__)
+
+if numpy is None:
+    logger.info("numpy not installed; history aggregation runs in pure Python.")
+
+Stats = Dict[str, List[array]]  # field -> [min, mean, max] columns
+
+def parse_stat(value: Any) -> float:
+    """Reads a stat that may be a number or a string such as "42%", "51.2°C" or "used/total" memory."""
+    if isinstance(value, bool) or value is None:
+        return NAN
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip().rstrip("%°C ").strip()
+        try:
+            if "/" in text:
+                used, total = (float(part) for part in text.split("/", 1))
+                return 100.0 * used / total if total else NAN
+            return float(text)
+        except ValueError:
+            return NAN
+    return NAN
+
+def sample_from_snapshot(data: Dict[str, Any]) -> List[float]:
+    """Extracts TELEMETRY_FIELDS from a get_pwnagotchi_data() result; memory is reported as percent used."""
+    device = data.get("device_info") or {}
+    session = data.get("session_stats") or {}
+    return [
+        parse_stat(device.get("cpu_load")),
+        parse_stat(device.get("memory")),
+        parse_stat(device.get("temperature")),
+        parse_stat(device.get("epoch")),
+        parse_stat(session.get("aps_total")),
+        parse_stat(session.get("handshakes_total")),
+    ]
+
+def json_floats(values: Sequence[float]) -> List[Optional[float]]:
+    return [None if v != v else v for v in values]
+
+def _bucketize_numpy(timestamps: array, stats: Stats, origin: float, bucket: float) -> Tuple[List[float], Dict[str, Dict[str, list]]]:
+    ts = numpy.frombuffer(timestamps, dtype=numpy.float64)
+    index = ((ts - origin) // bucket).astype(numpy.int64)
+    starts = numpy.flatnonzero(numpy.r_[True, index[1:] != index[:-1]])
+    result = {}
+    for field, columns in stats.items():
+        low, mean, high = (numpy.frombuffer(column, dtype=numpy.float32).astype(numpy.float64) for column in columns)
+        valid = ~numpy.isnan(mean)
+        counts = numpy.add.reduceat(valid.astype(numpy.int64), starts)
+        sums = numpy.add.reduceat(numpy.where(valid, mean, 0.0), starts)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        result[field] = {
+            "min": json_floats(numpy.fmin.reduceat(low, starts).tolist()),
+            "mean": json_floats(means.tolist()),
+            "max": json_floats(numpy.fmax.reduceat(high, starts).tolist()),
+        }
+    return (origin + index[starts] * bucket).tolist(), result
+
+def _bucketize_python(timestamps: array, stats: Stats, origin: float, bucket: float) -> Tuple[List[float], Dict[str, Dict[str, list]]]:
+    index = [int((t - origin) // bucket) for t in timestamps]
+    starts = [i for i in range(len(index)) if i == 0 or index[i] != index[i - 1]]
+    bounds = list(zip(starts, starts[1:] + [len(index)]))
+    result = {}
+    for field, (low, mean, high) in stats.items():
+        mins, means, maxs = [], [], []
+        for start, end in bounds:
+            values = [v for v in mean[start:end] if v == v]
+            lows = [v for v in low[start:end] if v == v]
+            highs = [v for v in high[start:end] if v == v]
+            mins.append(min(lows) if lows else None)
+            means.append(sum(values) / len(values) if values else None)
+            maxs.append(max(highs) if highs else None)
+        result[field] = {"min": mins, "mean": means, "max": maxs}
+    return [origin + index[start] * bucket for start in starts], result
+
+class RingBuffer:
+    """Fixed-capacity time series: a preallocated array per column, overwritten oldest first.
+
+    Memory use is set by the capacity alone. Timestamps must not go backwards; older samples
+    (e.g. from a clock being corrected on a board without an RTC) are dropped.
+    """
+    def __init__(self, columns: Sequence[str], capacity: int):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.timestamps = array("d", [NAN]) * capacity
+        self.values = [array("f", [NAN]) * capacity for _ in self.columns]
+        self.head = 0
+        self.count = 0
+
+    def last_timestamp(self) -> Optional[float]:
+        return self.timestamps[(self.head - 1) % self.capacity] if self.count else None
+
+    def append(self, timestamp: float, row: Sequence[float]) -> bool:
+        last = self.last_timestamp()
+        if last is not None and timestamp <= last:
+            return False
+        self.timestamps[self.head] = timestamp
+        for column, value in zip(self.values, row):
+            column[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return True
+
+    def _ordered(self, column: array) -> array:
+        if self.count < self.capacity:
+            return column[:self.count]
+        return column[self.head:] + column[:self.head]
+
+    def window(self, since: Optional[float] = None, until: Optional[float] = None) -> Tuple[array, List[array]]:
+        """Returns the timestamps and per-column values within [since, until], oldest first."""
+        timestamps = self._ordered(self.timestamps)
+        start = 0 if since is None else bisect.bisect_left(timestamps, since)
+        end = len(timestamps) if until is None else bisect.bisect_right(timestamps, until)
+        return timestamps[start:end], [self._ordered(column)[start:end] for column in self.values]
+
+    def rows(self) -> List[Tuple[float, ...]]:
+        timestamps, columns = self.window()
+        return list(zip(timestamps, *columns))
+
+class Rollup:
+    """Accumulates samples into fixed buckets and stores min/mean/max per field when a bucket closes."""
+    def __init__(self, fields: Sequence[str], step: int, capacity: int):
+        self.step = step
+        self.ring = RingBuffer([f"{field}_{stat}" for field in fields for stat in ("min", "mean", "max")], capacity)
+        self._bucket: Optional[float] = None
+        self._reset(len(fields))
+
+    def _reset(self, width: int):
+        self._count = [0] * width
+        self._sum = [0.0] * width
+        self._min = [math.inf] * width
+        self._max = [-math.inf] * width
+
+    def add(self, timestamp: float, row: Sequence[float]) -> Optional[Tuple[float, ...]]:
+        """Adds a sample; returns the finished (timestamp, *columns) row when it closes a bucket."""
+        bucket = timestamp - timestamp % self.step
+        closed = None
+        if self._bucket is not None and bucket != self._bucket:
+            closed = self._close()
+        self._bucket = bucket
+        for i, value in enumerate(row):
+            if value != value:
+                continue
+            self._count[i] += 1
+            self._sum[i] += value
+            if value < self._min[i]: self._min[i] = value
+            if value > self._max[i]: self._max[i] = value
+        return closed
+
+    def _close(self) -> Optional[Tuple[float, ...]]:
+        values: List[float] = []
+        for count, total, low, high in zip(self._count, self._sum, self._min, self._max):
+            values += (low, total / count, high) if count else (NAN, NAN, NAN)
+        row = (self._bucket, *values)
+        self._reset(len(self._count))
+        return row if self.ring.append(row[0], row[1:]) else None
+
+def _provisional_rows(fields: Sequence[str], step: int, timestamps: array, columns: List[array]) -> Tuple[array, List[array]]:
+    """Folds raw samples into rollup rows of `step` seconds, closing the still-open last bucket too."""
+    rollup = Rollup(fields, step, max(1, len(timestamps)))
+    for timestamp, row in zip(timestamps, zip(*columns)):
+        rollup.add(timestamp, row)
+    if timestamps: rollup._close()
+    return rollup.ring.window()
+
+class TelemetryStore:
+    """Bounded in-RAM history of device stats: raw samples plus minute and hour rollups.
+
+    Only closed rollup rows reach the SD card, buffered and appended FLUSH_ROWS at a time. Each
+    rollup file is rewritten from its ring once it holds twice the ring's capacity, so files stay
+    bounded too. load() and flush() block on file I/O and are meant to run in a worker thread.
+    """
+    def __init__(self, directory: Path = TELEMETRY_DIR, fields: Sequence[str] = TELEMETRY_FIELDS,
+                 raw_capacity: int = RAW_CAPACITY, rollups: Dict[str, Tuple[int, int]] = ROLLUPS):
+        self.directory = directory
+        self.fields = tuple(fields)
+        self.raw = RingBuffer(self.fields, raw_capacity)
+        self.rollups = {name: Rollup(self.fields, step, capacity) for name, (step, capacity) in rollups.items()}
+        self._pending: Dict[str, List[Tuple[float, ...]]] = {name: [] for name in self.rollups}
+        self._lock = threading.Lock()
+
+    @property
+    def resolutions(self) -> List[str]:
+        return ["raw", *self.rollups]
+
+    def record(self, timestamp: float, row: Sequence[float]) -> bool:
+        """Adds one sample. Returns True when enough rollup rows are pending that flush() should run."""
+        with self._lock:
+            if not self.raw.append(timestamp, row):
+                return False
+            for name, rollup in self.rollups.items():
+                closed = rollup.add(timestamp, row)
+                if closed is not None: self._pending[name].append(closed)
+            return any(len(rows) >= FLUSH_ROWS for rows in self._pending.values())
+
+    def query(self, resolution: str = "minute", since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        """Returns one resolution's samples within [since, until] as columns. Raises ValueError for an unknown resolution."""
+        if resolution == "raw":
+            ring, step = self.raw, None
+        elif resolution in self.rollups:
+            ring, step = self.rollups[resolution].ring, self.rollups[resolution].step
+        else:
+            raise ValueError(f"Unknown resolution '{resolution}'; expected one of {', '.join(self.resolutions)}")
+        with self._lock:
+            timestamps, columns = ring.window(since, until)
+        return {
+            "resolution": resolution,
+            "step": step,
+            "timestamps": timestamps.tolist(),
+            "series": {name: json_floats(values) for name, values in zip(ring.columns, columns)},
+        }
+
+    def aggregate(self, since: float, until: float, bucket: float, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Returns min/mean/max of each field per `bucket` seconds within [since, until].
+
+        Reads the coarsest rollup no coarser than the bucket, topped up with raw samples newer
+        than its last closed row so the current minute or hour is not missing. Those samples are
+        folded into provisional rollup rows first, so every row a bucket averages spans the same
+        time and a few minutes of raw samples do not outweigh an hour of rollup rows. Buckets are
+        aligned to multiples of `bucket` and empty ones are left out. Raises ValueError for an
+        unknown field or a query spanning more than MAX_BUCKETS buckets.
+        """
+        fields = list(fields or self.fields)
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}; expected any of {', '.join(self.fields)}")
+        origin = since - since % bucket
+        if (until - origin) / bucket > MAX_BUCKETS:
+            raise ValueError(f"Range spans more than {MAX_BUCKETS} buckets; use a larger bucket")
+        candidates = [(rollup.step, name) for name, rollup in self.rollups.items() if rollup.step <= bucket]
+        source = max(candidates)[1] if candidates else "raw"
+        positions = [self.fields.index(field) for field in fields]
+        with self._lock:
+            raw_since = since
+            if source == "raw":
+                timestamps = array("d")
+                stats = {field: [array("f")] * 3 for field in fields}
+            else:
+                rollup = self.rollups[source]
+                timestamps, columns = rollup.ring.window(since, until)
+                stats = {field: columns[3 * i:3 * i + 3] for field, i in zip(fields, positions)}
+                last = rollup.ring.last_timestamp()
+                if last is not None: raw_since = max(since, last + rollup.step)
+            raw_timestamps, raw_columns = self.raw.window(raw_since, until)
+        if source == "raw":
+            tail_timestamps, tail_stats = raw_timestamps, {field: [raw_columns[i]] * 3 for field, i in zip(fields, positions)}
+        else:
+            tail_timestamps, tail_columns = _provisional_rows(self.fields, self.rollups[source].step, raw_timestamps, raw_columns)
+            tail_stats = {field: tail_columns[3 * i:3 * i + 3] for field, i in zip(fields, positions)}
+        timestamps += tail_timestamps
+        stats = {field: [column + tail for column, tail in zip(stats[field], tail_stats[field])] for field in fields}
+        if timestamps:
+            bucketize = _bucketize_numpy if numpy is not None else _bucketize_python
+            starts, series = bucketize(timestamps, stats, origin, bucket)
+        else:
+            starts, series = [], {field: {"min": [], "mean": [], "max": []} for field in fields}
+        return {"since": since, "until": until, "bucket": bucket, "source": source, "timestamps": starts, "series": series}
+
+    def _path(self, name: str) -> Path:
+        return self.directory / f"{name}.bin"
+
+    def _row_format(self, name: str) -> struct.Struct:
+        return struct.Struct("<d" + "f" * len(self.rollups[name].ring.columns))
+
+    def load(self):
+        """Restores the rollup rings from their files, reading only the rows each ring can hold."""
+        for name, rollup in self.rollups.items():
+            path, row_format = self._path(name), self._row_format(name)
+            header = FILE_MAGIC + struct.pack("<H", len(rollup.ring.columns))
+            try:
+                with open(path, "rb") as f:
+                    layout_ok = f.read(len(header)) == header
+                    if layout_ok:
+                        size = os.fstat(f.fileno()).st_size - len(header)
+                        rows = size // row_format.size
+                        f.seek(len(header) + max(0, rows - rollup.ring.capacity) * row_format.size)
+                        data = f.read(min(rows, rollup.ring.capacity) * row_format.size)
+            except FileNotFoundError:
+                continue
+            if not layout_ok:
+                # Written for other fields; set it aside so new rows do not append to it.
+                logger.warning(f"Telemetry file {path} has an unexpected layout; moving it to {path.name}.old")
+                os.replace(path, path.with_name(path.name + ".old"))
+                continue
+            with self._lock:
+                for row in row_format.iter_unpack(data):
+                    rollup.ring.append(row[0], row[1:])
+            logger.info(f"Loaded {rollup.ring.count} {name} telemetry rows.")
+
+    def flush(self):
+        """Appends pending rollup rows to their files in one write each."""
+        with self._lock:
+            pending = {name: rows for name, rows in self._pending.items() if rows}
+            self._pending = {name: [] for name in self.rollups}
+            compact = {}
+            for name in pending:
+                ring = self.rollups[name].ring
+                path = self._path(name)
+                try:
+                    rows_on_disk = (path.stat().st_size - len(FILE_MAGIC) - 2) // self._row_format(name).size
+                except FileNotFoundError:
+                    rows_on_disk = 0
+                if rows_on_disk + len(pending[name]) > 2 * ring.capacity:
+                    compact[name] = ring.rows()
+        if not pending:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for name, rows in pending.items():
+            row_format = self._row_format(name)
+            header = FILE_MAGIC + struct.pack("<H", len(self.rollups[name].ring.columns))
+            path = self._path(name)
+            if name in compact:
+                tmp = path.with_suffix(".tmp")
+                with open(tmp, "wb") as f:
+                    f.write(header + b"".join(row_format.pack(*row) for row in compact[name]))
+                os.replace(tmp, path)
+                continue
+            with open(path, "ab") as f:
+                if f.tell() == 0: f.write(header)
+                f.write(b"".join(row_format.pack(*row) for row in rows))
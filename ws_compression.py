@@ -0,0 +1,76 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import Frame, Opcode
+
+try:
+    from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol as _BaseProtocol
+except ImportError:  # uvicorn releases before the sans-I/O implementation
+    from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol as _BaseProtocol
+
+# --- Configuration ---
+WS_DEFLATE_WINDOW_BITS = 12  # 9-15; each step doubles the per-connection compressor memory
+WS_DEFLATE_LEVEL = 6  # 1 (fastest) - 9 (smallest)
+WS_DEFLATE_MEM_LEVEL = 5  # 1-9; zlib's internal state size
+WS_DEFLATE_MIN_SIZE = 256  # bytes; smaller messages are sent uncompressed
+
+logger = logging.getLogger(__name__)
+
+compression_stats = {"messages": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate that leaves small messages uncompressed and counts bytes before and after.
+
+    RFC 7692 lets each message choose whether it is compressed, so skipping small ones is safe.
+    """
+    min_size = WS_DEFLATE_MIN_SIZE
+
+    def encode(self, frame: Frame) -> Frame:
+        if frame.opcode not in (Opcode.TEXT, Opcode.BINARY, Opcode.CONT):
+            return frame
+        compression_stats["bytes_in"] += len(frame.data)
+        if frame.opcode is not Opcode.CONT:
+            compression_stats["messages"] += 1
+        if frame.fin and frame.opcode is not Opcode.CONT and len(frame.data) < self.min_size:
+            compression_stats["bytes_out"] += len(frame.data)
+            return frame
+        encoded = super().encode(frame)
+        if frame.opcode is not Opcode.CONT:
+            compression_stats["compressed"] += 1
+        compression_stats["bytes_out"] += len(encoded.data)
+        return encoded
+
+class TunedDeflateFactory(ServerPerMessageDeflateFactory):
+    def process_request_params(self, params: List[Tuple[str, Optional[str]]], accepted_extensions: List[Any]) -> Tuple[List[Tuple[str, Optional[str]]], PerMessageDeflate]:
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            self.compress_settings,
+        )
+
+def deflate_factory() -> TunedDeflateFactory:
+    return TunedDeflateFactory(
+        server_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+        client_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+        compress_settings={"level": WS_DEFLATE_LEVEL, "memLevel": WS_DEFLATE_MEM_LEVEL},
+    )
+
+class TunedWebSocketProtocol(_BaseProtocol):
+    """uvicorn's websockets protocol with the tunable permessage-deflate above.
+
+    Select it with `uvicorn main:app --ws ws_compression:TunedWebSocketProtocol`; passing
+    `--ws-per-message-deflate false` still turns compression off entirely.
+    """
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        if self.config.ws_per_message_deflate:
+            # The sans-I/O implementation negotiates through self.conn, the legacy one through self.
+            getattr(self, "conn", self).available_extensions = [deflate_factory()]
+
+def get_compression_stats() -> Dict[str, Any]:
+    ratio = compression_stats["bytes_out"] / compression_stats["bytes_in"] if compression_stats["bytes_in"] else None
+    return {**compression_stats, "ratio": round(ratio, 3) if ratio is not None else None}